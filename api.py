@@ -1,17 +1,23 @@
 import os
 import json
+import asyncio
+import mmap
+import time
 import base64
-from typing import List, Dict, Any, Optional
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from pathlib import Path
 
+import anyio
 import uvicorn
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 
 from src.document_processor import DocumentProcessor
 from src.gemini_analyzer import GeminiAnalyzer, GeminiUnavailable
@@ -21,6 +27,7 @@ from src.storage import Storage
 from src.analyzer_router import AnalyzerRouter
 from src.email_integration import EmailIntegration
 from src.advanced_search import AdvancedSearch
+from src.security import get_password_hash
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -30,8 +37,21 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Uvicorn worker processes. The search index files are single-writer, so only raise this
+# when search indexing is served by one process.
+API_WORKERS = int(os.getenv("DS_API_WORKERS", "1"))
+
+# Verified tokens are cached briefly, keyed by a digest so raw tokens never sit in memory
+TOKEN_CACHE_TTL = 30
+TOKEN_CACHE_MAXSIZE = 10000
+# Sync dependencies run concurrently in the threadpool, so every access holds the lock
+_token_cache: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+# username -> user index, rebuilt from storage at most every USERS_INDEX_TTL seconds
+USERS_INDEX_TTL = 5.0
+_users_by_name_cache: Tuple[float, Dict[str, Dict[str, Any]]] = (0.0, {})
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 app = FastAPI(title="DocSense AI API", version="1.0.0")
@@ -55,6 +75,41 @@ router = AnalyzerRouter("gemini")
 email_integration = EmailIntegration()
 advanced_search = AdvancedSearch()
 
+# Search indexing (embedding + Whoosh write) runs off the request path
+index_queue: Optional[asyncio.Queue] = None
+
+def index_batch(batch: List[Dict[str, Any]]):
+    # user_ids come from storage when the batch is indexed, so a re-upload adds to the
+    # document's recipients instead of replacing the ones indexed before
+    for item in batch:
+        item["metadata"] = {**item["metadata"], "user_ids": storage.get_recipient_ids(int(item["doc_id"]))}
+    advanced_search.index_documents(batch)
+
+async def index_worker():
+    while True:
+        batch = [await index_queue.get()]
+        while not index_queue.empty():
+            batch.append(index_queue.get_nowait())
+        try:
+            await anyio.to_thread.run_sync(index_batch, batch)
+        except Exception as e:
+            print(f"Indexing error: {e}")
+        finally:
+            for _ in batch:
+                index_queue.task_done()
+
+@app.on_event("startup")
+async def start_index_worker():
+    global index_queue
+    index_queue = asyncio.Queue()
+    app.state.index_worker = asyncio.create_task(index_worker())
+
+@app.on_event("shutdown")
+async def stop_index_worker():
+    await index_queue.join()
+    app.state.index_worker.cancel()
+    await anyio.to_thread.run_sync(advanced_search.flush, True)
+
 # Pydantic models
 class UserCreate(BaseModel):
     username: str
@@ -79,11 +134,33 @@ class SearchQuery(BaseModel):
     filters: Optional[Dict[str, Any]] = None
 
 # Utility functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+def _hash_spooled(fp) -> Tuple[str, int]:
+    fp.seek(0)
+    fhash = processor.file_hash_stream(fp)
+    size = fp.tell()
+    fp.seek(0)
+    return fhash, size
+
+async def spool_upload(file: UploadFile) -> Tuple[Any, str]:
+    """Hash an upload chunk by chunk and return a read-only mmap over its spooled file.
+    Starlette already spools multipart bodies to a temp file, so nothing is read whole.
+    """
+    fhash, size = await anyio.to_thread.run_sync(_hash_spooled, file.file)
+    if not size:
+        return b"", fhash
+    return mmap.mmap(file.file.fileno(), 0, access=mmap.ACCESS_READ), fhash
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def analyze_upload(filename: str, content, fhash: str):
+    meta = processor.extract_metadata(filename, content, fhash)
+    fulltext = processor.extract_fulltext(content, meta.get("ext", ""), fhash)
+    quick = processor.quick_skim(content, meta, fhash, text=fulltext)
+
+    llm = None
+    if router.ready:
+        llm = router.analyze(content, role=meta.get("suggested_role", "manager"), fhash=fhash, ext=meta.get("ext", ""))
+    return meta, quick, llm, fulltext
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -92,24 +169,48 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def users_by_name(refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    global _users_by_name_cache
+    built_at, users = _users_by_name_cache
+    if refresh or time.monotonic() - built_at >= USERS_INDEX_TTL:
+        users = {u["username"]: u for u in storage.get_users()}
+        _users_by_name_cache = (time.monotonic(), users)
+    return users
+
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    key = hashlib.sha256(credentials.credentials.encode()).digest()[:16]
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached:
+            if cached[1] > now:
+                return cached[0]
+            _token_cache.pop(key, None)
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        # Get full user info
-        users = storage.get_users()
-        user = next((u for u in users if u["username"] == username), None)
+        # Get full user info; a miss may be a user registered since the last rebuild
+        user = users_by_name().get(username) or users_by_name(refresh=True).get(username)
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
-        return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+    # Never cache past the token's own expiry
+    expires_at = min(now + TOKEN_CACHE_TTL, float(payload.get("exp", now)))
+    with _token_cache_lock:
+        _token_cache[key] = (user, expires_at)
+        while len(_token_cache) > TOKEN_CACHE_MAXSIZE:
+            _token_cache.popitem(last=False)  # oldest insertion
+    return user
+
 def get_current_admin(current_user: dict = Depends(get_current_user)):
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
@@ -119,22 +220,22 @@ def get_current_admin(current_user: dict = Depends(get_current_user)):
 @app.post("/register", response_model=Token)
 async def register(user: UserCreate):
     # Check if user exists
-    if storage.authenticate_user(user.username, ""):  # Just check username
+    if storage.user_exists(user.username):
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_password = get_password_hash(user.password)
-    storage.create_user(user.username, user.email, hashed_password, user.role)
+    # bcrypt is deliberately slow; keep it off the event loop
+    hashed_password = await anyio.to_thread.run_sync(get_password_hash, user.password)
+    user_id = storage.create_user(user.username, user.email, hashed_password, user.role)
     
     access_token = create_access_token(
-        data={"sub": user.username, "role": user.role},
+        data={"sub": user.username, "role": user.role, "user_id": user_id},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/login", response_model=Token)
 async def login(user: UserLogin):
-    hashed_password = get_password_hash(user.password)
-    db_user = storage.authenticate_user(user.username, hashed_password)
+    db_user = await anyio.to_thread.run_sync(storage.authenticate_user, user.username, user.password)
     if not db_user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     
@@ -146,7 +247,34 @@ async def login(user: UserLogin):
 
 @app.get("/users")
 async def get_users(current_user: dict = Depends(get_current_admin)):
-    return storage.get_users()
+    return await anyio.to_thread.run_sync(storage.get_users)
+
+def save_upload(filename: str, fhash: str, meta, quick, llm, fulltext: str, recipient_ids: List[int]) -> int:
+    compliance_flags = compliance.check(meta, quick, llm)
+    
+    # Save document
+    doc_id = storage.save_document(
+        filename=filename,
+        file_hash=fhash,
+        meta=meta,
+        quick=quick,
+        llm=llm,
+        compliance=compliance_flags,
+        fulltext=fulltext,
+    )
+    
+    # Save recipients (before indexing: the index worker reads them back as user_ids)
+    storage.save_recipients(doc_id, recipient_ids)
+    return doc_id
+
+def notify_recipients(filename: str, meta, quick, llm, recipient_ids: List[int]):
+    recipient_emails = storage.get_emails_for_ids(recipient_ids)
+    email_integration.route_document({
+        "filename": filename,
+        "metadata": meta,
+        "quick_view": quick,
+        "llm_analysis": llm,
+    }, recipient_emails)
 
 @app.post("/upload")
 async def upload_document(
@@ -160,47 +288,26 @@ async def upload_document(
     except:
         raise HTTPException(status_code=400, detail="Invalid recipients format")
     
-    # Read file
-    content = await file.read()
-    meta = processor.extract_metadata(file.filename, content)
-    quick = processor.quick_skim(content, meta)
-    
-    llm = None
-    if router.ready:
-        llm = router.analyze(content, role=meta.get("suggested_role", "manager"))
-    
-    compliance_flags = compliance.check(meta, quick, llm)
-    
-    # Save document
-    fulltext = processor.extract_fulltext(content, meta.get("ext", ""))
-    fhash = processor.file_hash(content)
-    doc_id = storage.save_document(
-        filename=file.filename,
-        file_hash=fhash,
-        meta=meta,
-        quick=quick,
-        llm=llm,
-        compliance=compliance_flags,
-        fulltext=fulltext,
-    )
+    # Stream file to a shared read-only view, hashing as we go
+    content, fhash = await spool_upload(file)
+    try:
+        # Parsing/OCR and the LLM call block; run them in a worker thread
+        meta, quick, llm, fulltext = await anyio.to_thread.run_sync(analyze_upload, file.filename, content, fhash)
+    finally:
+        if isinstance(content, mmap.mmap):
+            content.close()
     
-    # Index for search
-    advanced_search.index_document(str(doc_id), file.filename, fulltext, meta)
+    # Compliance rules and the DB writes block too
+    doc_id = await anyio.to_thread.run_sync(save_upload, file.filename, fhash, meta, quick, llm, fulltext,
+                                            recipient_ids)
     
-    # Save recipients
-    storage.save_recipients(doc_id, recipient_ids)
+    # Index for search in the background
+    index_queue.put_nowait({"doc_id": str(doc_id), "filename": file.filename, "content": fulltext,
+                            "metadata": meta, "fhash": fhash})
     
-    # Send emails
+    # Send emails (SMTP round trips) off the event loop
     if email_integration.email_ready:
-        users = storage.get_users()
-        recipient_emails = [u["email"] for u in users if u["id"] in recipient_ids]
-        summary = quick.get("summary", "Document processed")
-        email_integration.route_document({
-            "filename": file.filename,
-            "metadata": meta,
-            "quick_view": quick,
-            "llm_analysis": llm,
-        }, recipient_emails)
+        await anyio.to_thread.run_sync(notify_recipients, file.filename, meta, quick, llm, recipient_ids)
     
     return {"doc_id": doc_id, "message": "Document processed and distributed"}
 
@@ -209,42 +316,30 @@ async def search_documents(
     search: SearchQuery,
     current_user: dict = Depends(get_current_user)
 ):
+    # Encoding the query (and the first model load) blocks; keep it off the event loop
     if current_user["role"] == "admin":
-        results = advanced_search_query(search.query, search.search_type, json.dumps(search.filters or {}))
+        results = await anyio.to_thread.run_sync(advanced_search_query, search.query, search.search_type,
+                                                 search.filters)
     else:
-        # For employees, only search their documents
-        user_docs = storage.get_user_documents(current_user["id"])
-        # Filter by query - simplified
-        results = [d for d in user_docs if search.query.lower() in d["filename"].lower() or search.query.lower() in json.dumps(d).lower()]
+        # For employees, only documents sent to them are ranked, whatever the filters say
+        results = await anyio.to_thread.run_sync(partial(advanced_search_query, search.query, search.search_type,
+                                                         search.filters, user_id=current_user["id"]))
     
     return results
 
 @app.get("/my-documents")
-async def get_my_documents(current_user: dict = Depends(get_current_user)):
-    # Need user id - assume we can get it from username
-    users = storage.get_users()
-    user = next((u for u in users if u["username"] == current_user["username"]), None)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return storage.get_user_documents(user["id"])
+async def get_my_documents(limit: Optional[int] = None, before_id: Optional[int] = None,
+                           current_user: dict = Depends(get_current_user)):
+    # Unpaged unless the client asks for a limit; page on with the last id as before_id
+    # get_current_user already resolved the full user record
+    return await anyio.to_thread.run_sync(partial(storage.get_user_documents, current_user["id"],
+                                                  limit=limit, before_id=before_id))
 
 # Helper function for search
-def advanced_search_query(query: str, search_type: str = "hybrid", filters: str = "") -> List[Dict[str, Any]]:
-    if search_type == "full_text":
-        results = advanced_search.full_text_search(query)
-    elif search_type == "semantic":
-        results = advanced_search.semantic_search(query)
-    else:
-        results = advanced_search.hybrid_search(query)
-    
-    if filters:
-        try:
-            filter_dict = json.loads(filters)
-            results = advanced_search.filter_by_metadata(filter_dict, results)
-        except:
-            pass
-    
-    return results
+def advanced_search_query(query: str, search_type: str = "hybrid", filters: Optional[Dict[str, Any]] = None,
+                          limit: int = 10, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    return advanced_search.search(query, search_type, filters, limit=limit, user_id=user_id)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # loop/http "auto" pick uvloop and httptools when installed (uvicorn[standard]), asyncio/h11 on Windows
+    uvicorn.run("api:app", host="0.0.0.0", port=8000, workers=API_WORKERS, loop="auto", http="auto")
\ No newline at end of file
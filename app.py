@@ -1,6 +1,7 @@
 import os
 import io
 import json
+import mmap
 import base64
 from typing import List, Dict, Any
 
@@ -43,25 +44,40 @@ sharepoint_sim = SharePointSimulator()
 uns_simulator.start_simulation()
 
 
+def _map_file(path: str):
+    """Read-only mmap of a file, shared by every consumer instead of a bytes copy."""
+    if not os.path.getsize(path):
+        return b""
+    with open(path, 'rb') as fh:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
 def process_documents(files: List[gr.File], save_history: bool = False) -> Dict[str, Any]:
     results = []
     nodes = []
     edges = []
+    seen = set()  # graph node ids / edges already emitted
 
     for f in files or []:
-        with open(f.name, 'rb') as fh:
-            content = fh.read()
-        meta = processor.extract_metadata(f.name, content)
-        quick = processor.quick_skim(content, meta)
-
-        llm = None
-        if LLM_READY:
-            llm = router.analyze(content, role=meta.get("suggested_role", "manager"))
+        content = _map_file(f.name)
+        try:
+            fhash = processor.file_hash(content)
+            meta = processor.extract_metadata(f.name, content, fhash)
+            fulltext = processor.extract_fulltext(content, meta.get("ext", ""), fhash)
+            quick = processor.quick_skim(content, meta, fhash, text=fulltext)
+
+            llm = None
+            if LLM_READY:
+                llm = router.analyze(content, role=meta.get("suggested_role", "manager"), fhash=fhash,
+                                     ext=meta.get("ext", ""))
+        finally:
+            if isinstance(content, mmap.mmap):
+                content.close()
 
         compliance_flags = compliance.check(meta, quick, llm)
 
         # Build knowledge graph nodes/edges
-        n, e = kg.build_from_document(meta, quick, llm)
+        n, e = kg.build_from_document(meta, quick, llm, seen)
         nodes.extend(n)
         edges.extend(e)
 
@@ -75,8 +91,6 @@ def process_documents(files: List[gr.File], save_history: bool = False) -> Dict[
 
         # Optionally persist full analysis with dedup by file hash
         if save_history:
-            fulltext = processor.extract_fulltext(content, meta.get("ext", ""))
-            fhash = processor.file_hash(content)
             doc_id = storage.save_document(
                 filename=f.name,
                 file_hash=fhash,
@@ -89,7 +103,7 @@ def process_documents(files: List[gr.File], save_history: bool = False) -> Dict[
             item["doc_id"] = doc_id
 
             # Index for advanced search
-            advanced_search.index_document(str(doc_id), f.name, fulltext, meta)
+            advanced_search.index_document(str(doc_id), f.name, fulltext, meta, fhash=fhash)
 
             # Send notification email if configured
             if email_integration.email_ready:
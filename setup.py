@@ -9,12 +9,7 @@ import sys
 sys.path.append('.')
 
 from src.storage import Storage
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+from src.security import get_password_hash
 
 def main():
     storage = Storage(".")
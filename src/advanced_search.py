@@ -1,54 +1,415 @@
 import os
+import time
+import heapq
+import atexit
+import threading
 import numpy as np
-from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Set, Tuple
 import whoosh.index as index
 from whoosh.fields import Schema, TEXT, ID, STORED
 from whoosh.qparser import QueryParser
+from whoosh.query import Or, Term
 from whoosh import scoring
+from whoosh.util.filelock import FileLock
 import json
 
+try:
+    import hnswlib
+except Exception:
+    hnswlib = None
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'  # Lightweight model
+EMBEDDING_DIM = 384
+EMBEDDINGS_FILE = 'embeddings.i8'
+LEGACY_EMBEDDINGS_FILE = 'embeddings.f32'
+IDS_FILE = 'ids.txt'  # one doc_id per line, appended in row order
+LEGACY_IDS_FILE = 'ids.npy'
+VECTORS_LOCK_FILE = 'vectors.lock'  # serialises matrix/ids appends across processes
+ANN_FILE = 'hnsw.bin'
+# HNSW graph parameters (used when hnswlib is installed)
+ANN_M = 16
+ANN_EF_CONSTRUCTION = 200
+ANN_EF_SEARCH = 64
+ANN_MIN_CAPACITY = 1024
+# Whoosh writes are buffered and committed in batches
+FLUSH_BATCH_SIZE = 64
+FLUSH_INTERVAL = 5.0  # seconds a pending write may wait before an idle commit
+WRITER_LIMIT_MB = 256
+WRITER_LOCK_TIMEOUT = 30.0  # wait for another process's writer; it commits within ~FLUSH_INTERVAL
+EMB_CACHE_SIZE = 1024  # embeddings memoised by file hash
+RRF_K = 60  # Reciprocal Rank Fusion damping constant
+# Segment merging: keep segment sizes geometric and fully optimise only when writes go idle
+GEOMETRIC_RATIO = 2
+COMPACT_IDLE_SECONDS = 300.0
+ENCODE_BATCH_SIZE = 32
+SCAN_BLOCK_ROWS = 8192  # bounds the float32 temporary while scoring the int8 matrix
+
+def quantize(vectors: np.ndarray) -> np.ndarray:
+    """Unit vectors -> int8 with scale 127."""
+    return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+
+def merge_geometric(writer, segments):
+    """Whoosh merge policy: sorted largest first, every segment must hold at least
+    GEOMETRIC_RATIO times the docs of all smaller segments combined. The smallest
+    run of segments that breaks this is merged into one, so a commit only rewrites
+    recent small segments and the segment count stays logarithmic in the doc count.
+    """
+    from whoosh.reading import SegmentReader
+
+    ordered = sorted(segments, key=lambda seg: seg.doc_count_all(), reverse=True)
+    cut = len(ordered)
+    smaller = 0
+    for i in range(len(ordered) - 1, -1, -1):
+        count = ordered[i].doc_count_all()
+        if smaller and count < GEOMETRIC_RATIO * smaller:
+            cut = i
+        smaller += count
+    if len(ordered) - cut < 2:
+        return segments
+    for seg in ordered[cut:]:
+        reader = SegmentReader(writer.storage, writer.schema, seg)
+        writer.add_reader(reader)
+        reader.close()
+    return ordered[:cut]
+
 class AdvancedSearch:
+    """Whoosh BM25 for full text; embeddings live in a unit-normalised, int8-quantised
+    matrix (index_dir/embeddings.i8, row order in ids.txt). When hnswlib is installed an HNSW
+    graph over the same rows (hnsw.bin) answers semantic queries; otherwise it is a blocked GEMV scan.
+    Several processes may share index_dir: rows and ids are only appended, under a file lock,
+    and each process picks up the others' rows before it reads or writes.
+    """
+
     def __init__(self, index_dir: str = 'search_index'):
         self.index_dir = index_dir
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')  # Lightweight model
+        self._model = None  # loaded on first encode
         self.schema = Schema(
             doc_id=ID(stored=True, unique=True),
             filename=TEXT(stored=True),
             content=TEXT,
-            metadata=STORED,
-            embedding=STORED
+            metadata=STORED
         )
         self._create_index_if_needed()
+        # Long-lived handle and parser; refresh() only reopens when a new generation is committed
+        self.ix = index.open_dir(self.index_dir)
+        self.parser = QueryParser("content", self.ix.schema)
+        self._emb_path = os.path.join(self.index_dir, EMBEDDINGS_FILE)
+        self._ids_path = os.path.join(self.index_dir, IDS_FILE)
+        self._ann_path = os.path.join(self.index_dir, ANN_FILE)
+        self._lock_path = os.path.join(self.index_dir, VECTORS_LOCK_FILE)
+        self._ann = None
+        self._ann_dirty = False  # graph holds rows not yet in hnsw.bin
+        self._lock = threading.RLock()
+        self._load_vectors()
+        self._load_ann()
+        self._writer = None
+        self._pending_ids = set()
+        self._first_pending_at = 0.0
+        self._flush_timer = None
+        self._compact_timer = None
+        self._emb_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # (field, value) -> doc_ids as of Whoosh generation _meta_generation. Our own commits are
+        # applied incrementally; a full rebuild only happens on cold start or someone else's commit
+        self._meta_postings: Dict[Tuple[str, Any], Set[str]] = defaultdict(set)
+        self._meta_items: Dict[str, List[Tuple[str, Any]]] = {}  # doc_id -> its posting keys
+        self._pending_meta: Dict[str, Dict[str, Any]] = {}  # metadata buffered in the writer
+        self._meta_generation = None
+        atexit.register(self.close)
+
+    @property
+    def model(self):
+        if self._model is None:
+            # Importing sentence_transformers pulls in torch; defer it until something is encoded
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(EMBEDDING_MODEL)
+        return self._model
+
+    def _index(self):
+        self.ix = self.ix.refresh()
+        return self.ix
 
     def _create_index_if_needed(self):
         if not os.path.exists(self.index_dir):
             os.makedirs(self.index_dir)
             ix = index.create_in(self.index_dir, self.schema)
 
-    def index_document(self, doc_id: str, filename: str, content: str, metadata: Dict[str, Any]):
+    @contextmanager
+    def _vectors_locked(self):
+        """Exclusive, cross-process hold on the matrix and ids files."""
+        lock = FileLock(self._lock_path)
+        while not lock.acquire(blocking=True):  # msvcrt gives up after ~10s; keep waiting
+            pass
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def _load_vectors(self):
+        self._ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._ids_offset = 0  # bytes of ids.txt read so far
+        with self._vectors_locked():
+            legacy_ids = os.path.join(self.index_dir, LEGACY_IDS_FILE)
+            if not os.path.exists(self._ids_path) and os.path.exists(legacy_ids):
+                with open(self._ids_path, 'w', encoding='utf-8') as fh:
+                    fh.writelines(f'{doc_id}\n' for doc_id in np.load(legacy_ids).tolist())
+                os.remove(legacy_ids)
+            count = self._read_new_ids()
+            legacy_path = os.path.join(self.index_dir, LEGACY_EMBEDDINGS_FILE)
+            if count and not os.path.exists(self._emb_path) and os.path.exists(legacy_path):
+                legacy = np.memmap(legacy_path, dtype=np.float32, mode='r', shape=(count, EMBEDDING_DIM))
+                quantize(legacy).tofile(self._emb_path)
+                del legacy
+                os.remove(legacy_path)
+            self._map_vectors()
+        if not self._ids:
+            self._migrate_stored_embeddings()
+
+    def _read_new_ids(self) -> int:
+        """Append ids other writers added since the last read; returns how many were new.
+        Only whole lines count: a writer appends its rows first and its ids last."""
+        try:
+            size = os.path.getsize(self._ids_path)
+        except FileNotFoundError:
+            return 0
+        if size <= self._ids_offset:
+            return 0
+        with open(self._ids_path, 'rb') as fh:
+            fh.seek(self._ids_offset)
+            chunk = fh.read(size - self._ids_offset)
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            return 0
+        new_ids = chunk[:end].decode('utf-8').splitlines()
+        for doc_id in new_ids:
+            self._row_of[doc_id] = len(self._ids)
+            self._ids.append(doc_id)
+        self._ids_offset += end
+        return len(new_ids)
+
+    def _sync_vectors(self):
+        """Pick up rows appended by other processes sharing index_dir (call with self._lock held)."""
+        start = len(self._ids)
+        if self._read_new_ids():
+            self._map_vectors()
+            if self._ann is not None:
+                self._add_to_ann(np.arange(start, len(self._ids)))
+
+    def _map_vectors(self):
+        if self._ids:
+            self._vectors = np.memmap(self._emb_path, dtype=np.int8, mode='r+',
+                                      shape=(len(self._ids), EMBEDDING_DIM))
+        else:
+            self._vectors = np.empty((0, EMBEDDING_DIM), dtype=np.int8)
+
+    def _load_ann(self):
+        if hnswlib is None:
+            return
+        ann = hnswlib.Index(space='cosine', dim=EMBEDDING_DIM)
+        if os.path.exists(self._ann_path):
+            ann.load_index(self._ann_path, max_elements=max(ANN_MIN_CAPACITY, len(self._ids)))
+            if ann.get_current_count() <= len(self._ids):
+                ann.set_ef(ANN_EF_SEARCH)
+                self._ann = ann
+                # Saved on flush/close, so it may trail the matrix: add just the rows it lacks
+                missing = np.setdiff1d(np.arange(len(self._ids)), np.asarray(ann.get_ids_list(), dtype=np.int64))
+                if len(missing):
+                    self._add_to_ann(missing)
+                return
+            ann = hnswlib.Index(space='cosine', dim=EMBEDDING_DIM)
+        # Missing or out of step with the matrix: rebuild from it
+        ann.init_index(max_elements=max(ANN_MIN_CAPACITY, 2 * len(self._ids)),
+                       ef_construction=ANN_EF_CONSTRUCTION, M=ANN_M)
+        ann.set_ef(ANN_EF_SEARCH)
+        self._ann = ann
+        if self._ids:
+            self._add_to_ann(np.arange(len(self._ids)))
+
+    def _add_to_ann(self, rows: np.ndarray):
+        """Insert (or replace) matrix rows in the HNSW graph, labelled by row number; saved by _save_ann()."""
+        needed = self._ann.get_current_count() + len(rows)
+        if needed > self._ann.get_max_elements():
+            self._ann.resize_index(max(needed, 2 * self._ann.get_max_elements()))
+        self._ann.add_items(self._vectors[rows].astype(np.float32) / 127, rows)
+        self._ann_dirty = True
+
+    def _save_ann(self):
+        """Write the graph to hnsw.bin if it changed; a full O(N) dump, so only on commit/close."""
+        with self._lock:
+            if self._ann is None or not self._ann_dirty:
+                return
+            with self._vectors_locked():
+                self._sync_vectors()  # what we save covers every row appended so far
+                self._ann.save_index(self._ann_path)
+            self._ann_dirty = False
+
+    def _migrate_stored_embeddings(self):
+        """Older indexes kept each embedding as JSON in a stored Whoosh field; lift them into the matrix once."""
+        ix = self.ix
+        if 'embedding' not in ix.schema.names():
+            return
+        with ix.searcher() as searcher:
+            stored = [(doc['doc_id'], json.loads(doc['embedding']))
+                      for doc in searcher.all_stored_fields() if doc.get('embedding')]
+        if stored:
+            self._store_vectors([doc_id for doc_id, _ in stored], np.array([e for _, e in stored]))
+
+    def _store_vectors(self, doc_ids: List[str], embeddings: np.ndarray):
+        """Normalise, quantise and write rows; known doc_ids are overwritten in place, new ones appended."""
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(doc_ids), EMBEDDING_DIM)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = quantize(vectors / np.where(norms == 0, 1, norms))
+
+        with self._vectors_locked():
+            # Another process may have appended since we last looked; build on its rows, not over them
+            self._sync_vectors()
+            mapped = len(self._vectors)
+            new_ids = []
+            new_rows = []
+            touched = set()
+            for doc_id, vec in zip(doc_ids, vectors):
+                row = self._row_of.get(doc_id)
+                if row is None:
+                    self._row_of[doc_id] = len(self._ids)
+                    self._ids.append(doc_id)
+                    new_ids.append(doc_id)
+                    new_rows.append(vec)
+                elif row >= mapped:
+                    new_rows[row - mapped] = vec
+                else:
+                    self._vectors[row] = vec
+                touched.add(self._row_of[doc_id])
+            if isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+            if new_rows:
+                # Rows go in before their ids, so readers never see an id without its row.
+                # Explicit offsets (not append) overwrite whatever an interrupted writer left behind.
+                with open(self._emb_path, 'r+b' if os.path.exists(self._emb_path) else 'wb') as fh:
+                    fh.seek(mapped * EMBEDDING_DIM)
+                    fh.write(np.stack(new_rows).tobytes())
+                with open(self._ids_path, 'r+b' if os.path.exists(self._ids_path) else 'wb') as fh:
+                    fh.seek(self._ids_offset)
+                    fh.write(''.join(f'{doc_id}\n' for doc_id in new_ids).encode('utf-8'))
+                    fh.truncate()
+                    self._ids_offset = fh.tell()
+                self._map_vectors()
+        if self._ann is not None:
+            self._add_to_ann(np.array(sorted(touched)))
+
+    def index_document(self, doc_id: str, filename: str, content: str, metadata: Dict[str, Any],
+                       fhash: Optional[str] = None):
         """Index a document for search"""
-        embedding = self.model.encode(content).tolist()
-
-        ix = index.open_dir(self.index_dir)
-        writer = ix.writer()
-        writer.add_document(
-            doc_id=doc_id,
-            filename=filename,
-            content=content,
-            metadata=json.dumps(metadata),
-            embedding=json.dumps(embedding)
-        )
-        writer.commit()
+        self.index_documents([{'doc_id': doc_id, 'filename': filename, 'content': content,
+                               'metadata': metadata, 'fhash': fhash}])
+
+    def index_documents(self, docs: List[Dict[str, Any]]):
+        """Index many documents with one batched encode and one commit.
+        Each doc is a dict with doc_id, filename, content, metadata and optionally fhash;
+        docs whose fhash was encoded before reuse that embedding.
+        """
+        if not docs:
+            return
+        embeddings = self._encode_documents(docs)
+        with self._lock:
+            self._store_vectors([d['doc_id'] for d in docs], embeddings)
 
-    def full_text_search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Perform full-text search using Whoosh"""
-        ix = index.open_dir(self.index_dir)
-        with ix.searcher(weighting=scoring.BM25F) as searcher:
-            query_parser = QueryParser("content", ix.schema)
-            parsed_query = query_parser.parse(query)
-            results = searcher.search(parsed_query, limit=limit)
+            for d in docs:
+                if d['doc_id'] in self._pending_ids:
+                    # update_document only replaces committed copies
+                    self.flush(force=True)
+                if self._writer is None:
+                    self._writer = self._index().writer(limitmb=WRITER_LIMIT_MB, timeout=WRITER_LOCK_TIMEOUT)
+                    self._first_pending_at = time.monotonic()
+                    self._flush_timer = threading.Timer(FLUSH_INTERVAL, self.flush, kwargs={'force': True})
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+                self._writer.update_document(
+                    doc_id=d['doc_id'],
+                    filename=d['filename'],
+                    content=d['content'],
+                    metadata=json.dumps(d['metadata'])
+                )
+                self._pending_ids.add(d['doc_id'])
+                self._pending_meta[d['doc_id']] = d['metadata']
+            self.flush()
+
+    def _encode_documents(self, docs: List[Dict[str, Any]]) -> np.ndarray:
+        embeddings = np.empty((len(docs), EMBEDDING_DIM), dtype=np.float32)
+        missing = []
+        for i, d in enumerate(docs):
+            cached = self._emb_cache.get(d.get('fhash')) if d.get('fhash') else None
+            if cached is None:
+                missing.append(i)
+            else:
+                self._emb_cache.move_to_end(d['fhash'])
+                embeddings[i] = cached
+        if missing:
+            embeddings[missing] = self.model.encode([docs[i]['content'] for i in missing],
+                                                    batch_size=ENCODE_BATCH_SIZE,
+                                                    convert_to_numpy=True, normalize_embeddings=True)
+            for i in missing:
+                if docs[i].get('fhash'):
+                    self._emb_cache[docs[i]['fhash']] = embeddings[i]
+            while len(self._emb_cache) > EMB_CACHE_SIZE:
+                self._emb_cache.popitem(last=False)
+        return embeddings
+
+    def flush(self, force: bool = False):
+        """Commit buffered writes once FLUSH_BATCH_SIZE docs are pending, after FLUSH_INTERVAL, or when forced."""
+        with self._lock:
+            if not self._pending_ids:
+                return
+            if not (force or len(self._pending_ids) >= FLUSH_BATCH_SIZE
+                    or time.monotonic() - self._first_pending_at >= FLUSH_INTERVAL):
+                return
+            writer, self._writer = self._writer, None
+            writer.commit(mergetype=merge_geometric)
+            if self._meta_generation == writer.generation - 1:
+                # Postings were current right up to this commit: fold the batch in, no rescan
+                for doc_id, metadata in self._pending_meta.items():
+                    self._set_postings(doc_id, metadata)
+                self._meta_generation = writer.generation
+            self._pending_ids.clear()
+            self._pending_meta.clear()
+            self._save_ann()
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            # (Re)arm the idle compaction; any later commit pushes it back again
+            if self._compact_timer is not None:
+                self._compact_timer.cancel()
+            self._compact_timer = threading.Timer(COMPACT_IDLE_SECONDS, self.compact)
+            self._compact_timer.daemon = True
+            self._compact_timer.start()
+
+    def compact(self):
+        """Merge all segments into one; scheduled after COMPACT_IDLE_SECONDS without commits."""
+        with self._lock:
+            if self._writer is not None:
+                return
+            writer = self._index().writer(timeout=WRITER_LOCK_TIMEOUT)
+            writer.commit(optimize=True)
+            if self._meta_generation == writer.generation - 1:
+                self._meta_generation = writer.generation  # same documents, merged segments
+            self._compact_timer = None
+
+    def close(self):
+        """Commit anything still buffered and save the HNSW graph; called at interpreter exit."""
+        self.flush(force=True)
+        self._save_ann()
+
+    def full_text_search(self, query: str, limit: int = 10, allowed: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """Perform full-text search using Whoosh; with ``allowed``, only those doc_ids are ranked.
+        Searches the committed index; buffered writes show up after the next batch or idle commit."""
+        if allowed is not None and not allowed:
+            return []
+        with self._index().searcher(weighting=scoring.BM25F) as searcher:
+            parsed_query = self.parser.parse(query)
+            only = Or([Term('doc_id', doc_id) for doc_id in allowed]) if allowed is not None else None
+            results = searcher.search(parsed_query, limit=limit, filter=only)
 
             search_results = []
             for hit in results:
@@ -60,59 +421,183 @@ class AdvancedSearch:
                 })
             return search_results
 
-    def semantic_search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Perform semantic search using embeddings"""
-        query_embedding = self.model.encode(query)
+    def semantic_search(self, query: str, limit: int = 10, allowed: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """Perform semantic search using embeddings; with ``allowed``, only those doc_ids are ranked."""
+        with self._lock:
+            self._sync_vectors()
+        if not self._ids or limit <= 0 or (allowed is not None and not allowed):
+            return []
+        query_embedding = np.asarray(self.model.encode(query), dtype=np.float32)
+        query_embedding /= np.linalg.norm(query_embedding) or 1.0
 
-        ix = index.open_dir(self.index_dir)
-        with ix.searcher() as searcher:
+        with self._lock:
+            if allowed is None:
+                top, scores = self._nearest(query_embedding, min(limit, len(self._ids)))
+            else:
+                rows = np.array(sorted(self._row_of[d] for d in allowed if d in self._row_of), dtype=np.int64)
+                top, scores = self._nearest_among(query_embedding, rows, limit)
+            doc_ids = [self._ids[row] for row in top]
+
+        with self._index().searcher() as searcher:
             results = []
-            for doc in searcher.all_stored_fields():
-                doc_embedding = np.array(json.loads(doc['embedding']))
-                similarity = cosine_similarity([query_embedding], [doc_embedding])[0][0]
+            for doc_id, score in zip(doc_ids, scores):
+                doc = searcher.document(doc_id=doc_id)
+                if doc is None:
+                    continue
                 results.append({
                     'doc_id': doc['doc_id'],
                     'filename': doc['filename'],
-                    'similarity': float(similarity),
+                    'similarity': float(score),
                     'metadata': json.loads(doc['metadata'])
                 })
+            return results
 
-            # Sort by similarity
-            results.sort(key=lambda x: x['similarity'], reverse=True)
-            return results[:limit]
-
-    def hybrid_search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Combine full-text and semantic search"""
-        fts_results = self.full_text_search(query, limit=limit*2)
-        semantic_results = self.semantic_search(query, limit=limit*2)
-
-        # Combine and deduplicate
-        combined = {}
-        for result in fts_results + semantic_results:
-            doc_id = result['doc_id']
-            if doc_id not in combined:
-                combined[doc_id] = result
-            else:
-                # Average scores
-                if 'score' in result and 'score' in combined[doc_id]:
-                    combined[doc_id]['score'] = (combined[doc_id]['score'] + result['score']) / 2
-                elif 'similarity' in result:
-                    combined[doc_id]['similarity'] = result['similarity']
+    def _nearest(self, query_embedding: np.ndarray, k: int):
+        """Top-k rows by cosine similarity, best first, as (rows, similarities)."""
+        if self._ann is not None:
+            self._ann.set_ef(max(ANN_EF_SEARCH, k))
+            labels, distances = self._ann.knn_query(query_embedding, k=k)
+            return labels[0], 1 - distances[0]
+
+        # Rows are unit vectors scaled by 127, so matrix-vector products give every cosine similarity.
+        # Blocks are widened to float32 so the product runs through BLAS sgemv.
+        sims = np.empty(len(self._vectors), dtype=np.float32)
+        for start in range(0, len(self._vectors), SCAN_BLOCK_ROWS):
+            block = self._vectors[start:start + SCAN_BLOCK_ROWS]
+            sims[start:start + len(block)] = block.astype(np.float32) @ query_embedding
+        sims /= 127
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return top, sims[top]
 
-        # Sort by combined score
-        sorted_results = list(combined.values())
-        sorted_results.sort(key=lambda x: x.get('score', 0) + x.get('similarity', 0), reverse=True)
-        return sorted_results[:limit]
+    def _nearest_among(self, query_embedding: np.ndarray, rows: np.ndarray, k: int):
+        """Exact top-k over the given rows only (a per-user subset), best first."""
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+        sims = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+            block = self._vectors[rows[start:start + SCAN_BLOCK_ROWS]]
+            sims[start:start + len(block)] = block.astype(np.float32) @ query_embedding
+        sims /= 127
+        k = min(k, len(rows))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return rows[top], sims[top]
+
+    def hybrid_search(self, query: str, limit: int = 10, allowed: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """Combine full-text and semantic search with Reciprocal Rank Fusion.
+        BM25 scores and cosine similarities are not comparable, so only ranks are fused.
+        """
+        fts_results = self.full_text_search(query, limit=limit*2, allowed=allowed)
+        semantic_results = self.semantic_search(query, limit=limit*2, allowed=allowed)
+
+        scores: Dict[str, float] = defaultdict(float)
+        first_seen: Dict[str, Dict[str, Any]] = {}
+        for results in (fts_results, semantic_results):
+            for rank, result in enumerate(results):
+                scores[result['doc_id']] += 1.0 / (RRF_K + rank)
+                first_seen.setdefault(result['doc_id'], result)
+
+        top = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        return [{**first_seen[doc_id], 'score': score} for doc_id, score in top]
+
+    @staticmethod
+    def _posting_keys(metadata: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        """Scalar fields give (key, value), list fields give (key + '_contains', item) per item.
+        Unhashable (nested) values are left out and matched per result instead."""
+        keys = []
+        for key, value in metadata.items():
+            for item in [(f'{key}_contains', v) for v in value] if isinstance(value, list) else [(key, value)]:
+                try:
+                    hash(item)
+                except TypeError:
+                    continue
+                keys.append(item)
+        return keys
+
+    def _set_postings(self, doc_id: str, metadata: Dict[str, Any]):
+        """Point doc_id's postings at its new metadata (call with self._lock held)."""
+        for item in self._meta_items.pop(doc_id, ()):
+            ids = self._meta_postings.get(item)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._meta_postings[item]
+        keys = self._posting_keys(metadata)
+        for item in keys:
+            self._meta_postings[item].add(doc_id)
+        self._meta_items[doc_id] = keys
+
+    def _metadata_postings(self) -> Dict[Tuple[str, Any], Set[str]]:
+        """Inverted metadata index over committed documents (call with self._lock held).
+        Rebuilt from stored fields only when the generation moved under us (cold start, another process).
+        """
+        ix = self._index()
+        generation = ix.latest_generation()
+        if generation != self._meta_generation:
+            self._meta_postings, self._meta_items = defaultdict(set), {}
+            with ix.searcher() as searcher:
+                for doc in searcher.all_stored_fields():
+                    self._set_postings(doc['doc_id'], json.loads(doc['metadata']))
+            self._meta_generation = generation
+        return self._meta_postings
 
     def filter_by_metadata(self, filters: Dict[str, Any], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Filter search results by metadata"""
+        """Filter search results by metadata.
+        A key ending in '_contains' matches when the value is in that list field (e.g. user_ids_contains).
+        Hashable filter values are answered by intersecting posting sets; the rest are checked per result.
+        """
+        allowed: Optional[Set[str]] = None
+        residual = {}
+        with self._lock:  # commits update the posting sets in place
+            postings = self._metadata_postings()
+            for key, value in filters.items():
+                try:
+                    ids = postings.get((key, value), set())
+                except TypeError:
+                    residual[key] = value
+                    continue
+                allowed = set(ids) if allowed is None else allowed & ids
+
         filtered = []
         for result in results:
+            if allowed is not None and result['doc_id'] not in allowed:
+                continue
             match = True
-            for key, value in filters.items():
-                if key not in result['metadata'] or result['metadata'][key] != value:
+            for key, value in residual.items():
+                if key.endswith('_contains'):
+                    # Only list fields contain anything (as in the postings); never raise on str/scalar fields
+                    field = result['metadata'].get(key[:-len('_contains')])
+                    if not isinstance(field, list) or value not in field:
+                        match = False
+                        break
+                elif key not in result['metadata'] or result['metadata'][key] != value:
                     match = False
                     break
             if match:
                 filtered.append(result)
-        return filtered
\ No newline at end of file
+        return filtered
+
+    def docs_for_user(self, user_id: int) -> Set[str]:
+        """doc_ids whose committed user_ids include ``user_id``."""
+        with self._lock:
+            return set(self._metadata_postings().get(('user_ids_contains', user_id), ()))
+
+    def search(self, query: str, search_type: str = "hybrid", filters: Optional[Dict[str, Any]] = None,
+               limit: int = 10, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Rank with the given search type, then apply metadata filters.
+        With ``user_id`` only documents sent to that user are ranked at all, so the
+        restriction holds whatever the filters are (and fails closed: no documents, no results).
+        """
+        allowed = self.docs_for_user(user_id) if user_id is not None else None
+        if search_type == "full_text":
+            results = self.full_text_search(query, limit=limit, allowed=allowed)
+        elif search_type == "semantic":
+            results = self.semantic_search(query, limit=limit, allowed=allowed)
+        else:
+            results = self.hybrid_search(query, limit=limit, allowed=allowed)
+        if filters:
+            results = self.filter_by_metadata(filters, results)
+        if allowed is not None:
+            results = [r for r in results if r['doc_id'] in allowed]
+        return results
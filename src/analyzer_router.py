@@ -23,10 +23,10 @@ class AnalyzerRouter:
             return self.gemini is not None
         return False
 
-    def analyze(self, content: bytes, role: str = "manager") -> Dict[str, Any]:
+    def analyze(self, content: bytes, role: str = "manager", fhash: Optional[str] = None, ext: str = "") -> Dict[str, Any]:
         if self.provider == "gemini" and self.gemini:
             try:
-                return self.gemini.analyze_document(content, role=role)
+                return self.gemini.analyze_document(content, role=role, fhash=fhash, ext=ext)
             except Exception as e:
                 return {"error": str(e)}
         # default no-LLM path
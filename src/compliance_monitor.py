@@ -1,5 +1,10 @@
 from typing import Dict, Any, List
 
+try:
+    import ahocorasick
+except Exception:
+    ahocorasick = None
+
 # Simple rules to mimic CMRS/MoHUA compliance checks. Extend as needed.
 RULES = [
     {
@@ -30,6 +35,28 @@ RULES = [
 
 
 class ComplianceMonitor:
+    def __init__(self, rules: List[Dict[str, Any]] = RULES):
+        self.rules = rules
+        # With pyahocorasick, one automaton over every rule keyword scans the text once;
+        # without it, per-rule substring checks (a regex alternation is slower than str.__contains__)
+        self.ac = None
+        if ahocorasick is not None:
+            self.ac = ahocorasick.Automaton()
+            for idx, rule in enumerate(rules):
+                for k in rule["keywords"]:
+                    self.ac.add_word(k, self.ac.get(k, ()) + (idx,))
+            self.ac.make_automaton()
+
+    def _matched_rules(self, blob: str) -> List[Dict[str, Any]]:
+        if self.ac is None:
+            return [rule for rule in self.rules if any(k in blob for k in rule["keywords"])]
+        matched = set()
+        for _, idxs in self.ac.iter(blob):
+            matched.update(idxs)
+            if len(matched) == len(self.rules):
+                break
+        return [rule for idx, rule in enumerate(self.rules) if idx in matched]
+
     def check(self, meta: Dict[str, Any], quick: Dict[str, Any], llm: Dict[str, Any] | None) -> List[Dict[str, str]]:
         hits = []
         text_parts: List[str] = []
@@ -40,7 +67,6 @@ class ComplianceMonitor:
             text_parts.extend([str(x) for x in llm.get("summary", [])])
 
         blob = "\n".join(text_parts).lower()
-        for rule in RULES:
-            if any(k in blob for k in rule["keywords"]):
-                hits.append({"id": rule["id"], "message": rule["message"], "severity": rule["severity"]})
+        for rule in self._matched_rules(blob):
+            hits.append({"id": rule["id"], "message": rule["message"], "severity": rule["severity"]})
         return hits
\ No newline at end of file
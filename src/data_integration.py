@@ -1,87 +1,202 @@
-import random
+import re
 import time
+import asyncio
 from datetime import datetime, timedelta
 from typing import Dict, Any, List
 import json
 import threading
+from collections import defaultdict
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
+
+SENSOR_INTERVAL = 5.0  # seconds between simulated sensor updates
+# Per-tick fluctuation half-widths for temperature, vibration, pressure
+_NOISE_SCALE = np.array([[2.0], [0.5], [5.0]], dtype=np.float32)
+_STATUS_NAMES = np.array(['operational', 'warning', 'critical'], dtype=object)
+
+
+def _sensor_step_numpy(temp, vib, pres, r_t, r_v, r_p):
+    """Apply one tick of noise; returns new arrays plus status codes (0 ok, 1 warning, 2 critical)."""
+    temp = np.clip(temp + r_t, 15, 100)
+    vib = np.maximum(vib + r_v, 0)
+    pres = np.maximum(pres + r_p, 0)
+    codes = (temp > 60).astype(np.int8) + (temp > 75)
+    return temp, vib, pres, codes
+
+
+@lru_cache(maxsize=None)
+def _sensor_step_impl():
+    """Tick kernel: numba-compiled (and warmed up) when numba is installed, else NumPy."""
+    try:
+        from numba import njit, prange
+    except Exception:
+        return _sensor_step_numpy
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _sensor_step(temp, vib, pres, r_t, r_v, r_p):
+        n = temp.shape[0]
+        t_out = np.empty_like(temp)
+        v_out = np.empty_like(vib)
+        p_out = np.empty_like(pres)
+        codes = np.empty(n, dtype=np.int8)
+        for i in prange(n):
+            t = min(max(temp[i] + r_t[i], 15.0), 100.0)
+            t_out[i] = t
+            v_out[i] = max(vib[i] + r_v[i], 0.0)
+            p_out[i] = max(pres[i] + r_p[i], 0.0)
+            codes[i] = 2 if t > 75 else (1 if t > 60 else 0)
+        return t_out, v_out, p_out, codes
+
+    # Compile now so the first real tick does not pay for it. numba specialises on writability:
+    # the state arrays are published read-only, the noise rows are fresh writable arrays
+    state = np.zeros(1, dtype=np.float32)
+    state.setflags(write=False)
+    noise = np.zeros(1, dtype=np.float32)
+    _sensor_step(state, state, state, noise, noise, noise)
+    return _sensor_step
+
+_WORD_RE = re.compile(r"\w+")
+_WORD_QUERY_RE = re.compile(r"[\w\s]*\w[\w\s]*")
 
 class UnifiedNamespaceSimulator:
     """Simulates a Unified Namespace for real-time data integration"""
 
-    def __init__(self):
+    def __init__(self, interval: float = SENSOR_INTERVAL):
         self.assets = {
             'train_001': {'type': 'rolling_stock', 'status': 'operational', 'location': 'station_A'},
             'track_005': {'type': 'infrastructure', 'status': 'maintenance', 'location': 'sector_B'},
             'signal_010': {'type': 'signaling', 'status': 'active', 'location': 'junction_C'},
             'power_020': {'type': 'electrical', 'status': 'warning', 'location': 'depot_D'}
         }
-        self.iot_sensors = {}
+        self.interval = interval
+        self._rng = np.random.default_rng()
         self._generate_sensors()
         self.running = False
+        self._task = None
+        self._updated = None
+        self._stop = threading.Event()
 
     def _generate_sensors(self):
-        """Generate mock IoT sensors for assets"""
-        for asset_id, asset_info in self.assets.items():
-            self.iot_sensors[asset_id] = {
-                'temperature': random.uniform(20, 80),
-                'vibration': random.uniform(0, 10),
-                'pressure': random.uniform(0, 100),
-                'last_updated': datetime.now().isoformat()
-            }
+        """Generate mock IoT sensors for assets, one array per reading indexed by asset"""
+        n = len(self.assets)
+        self._publish(
+            {asset_id: i for i, asset_id in enumerate(self.assets)},
+            {asset_id: MappingProxyType(dict(info)) for asset_id, info in self.assets.items()},
+            self._rng.uniform(20, 80, size=n).astype(np.float32),
+            self._rng.uniform(0, 10, size=n).astype(np.float32),
+            self._rng.uniform(0, 100, size=n).astype(np.float32),
+            np.array([a['status'] for a in self.assets.values()], dtype=object),
+        )
+
+    def _publish(self, idx, static, temp, vib, pressure, status):
+        """Swap in a new read-only snapshot with one attribute rebind.
+
+        The snapshot is (asset index, static asset info, temperature, vibration, pressure,
+        status, last_updated). Readers load self._state once and never see a torn update,
+        so the read path needs no lock.
+        """
+        for arr in (temp, vib, pressure, status):
+            arr.setflags(write=False)
+        self._state = (idx, static, temp, vib, pressure, status, datetime.now().isoformat())
+
+    @staticmethod
+    def _asset_row(state, asset_id: str, with_static: bool = True) -> Dict[str, Any]:
+        idx, static, temp, vib, pressure, status, last_updated = state
+        i = idx[asset_id]
+        data = dict(static[asset_id]) if with_static else {}
+        if with_static:
+            data['status'] = status[i]
+        data.update({
+            'temperature': float(temp[i]),
+            'vibration': float(vib[i]),
+            'pressure': float(pressure[i]),
+            'last_updated': last_updated,
+        })
+        return data
+
+    @property
+    def iot_sensors(self) -> Dict[str, Dict[str, Any]]:
+        """Per-asset sensor readings, materialised from the arrays"""
+        state = self._state
+        return {asset_id: self._asset_row(state, asset_id, with_static=False) for asset_id in state[0]}
 
     def get_asset_data(self, asset_id: str) -> Dict[str, Any]:
         """Get current data for a specific asset"""
-        if asset_id in self.assets:
-            data = self.assets[asset_id].copy()
-            data.update(self.iot_sensors.get(asset_id, {}))
-            return data
-        return {}
+        state = self._state
+        if asset_id not in state[0]:
+            return {}
+        return self._asset_row(state, asset_id)
 
     def get_all_assets(self) -> Dict[str, Dict[str, Any]]:
         """Get data for all assets"""
-        all_data = {}
-        for asset_id, asset_info in self.assets.items():
-            all_data[asset_id] = asset_info.copy()
-            all_data[asset_id].update(self.iot_sensors.get(asset_id, {}))
-        return all_data
-
-    def update_sensor_data(self):
-        """Simulate real-time sensor updates"""
-        while self.running:
-            for asset_id in self.iot_sensors:
-                # Simulate realistic sensor fluctuations
-                self.iot_sensors[asset_id]['temperature'] += random.uniform(-2, 2)
-                self.iot_sensors[asset_id]['temperature'] = max(15, min(100, self.iot_sensors[asset_id]['temperature']))
+        state = self._state
+        return {asset_id: self._asset_row(state, asset_id) for asset_id in state[0]}
 
-                self.iot_sensors[asset_id]['vibration'] += random.uniform(-0.5, 0.5)
-                self.iot_sensors[asset_id]['vibration'] = max(0, self.iot_sensors[asset_id]['vibration'])
+    async def wait_for_update(self) -> Dict[str, Dict[str, Any]]:
+        """Wait for the next tick of the asyncio simulation, then return all assets"""
+        if self._updated is None:
+            self._updated = asyncio.Event()
+        await self._updated.wait()
+        return self.get_all_assets()
 
-                self.iot_sensors[asset_id]['pressure'] += random.uniform(-5, 5)
-                self.iot_sensors[asset_id]['pressure'] = max(0, self.iot_sensors[asset_id]['pressure'])
+    def _tick(self):
+        """Advance every sensor by one step in a few vectorised operations"""
+        idx, static, temp, vib, pressure, _, _ = self._state
+        # Simulate realistic sensor fluctuations: one bulk draw, uniform in +/- each scale
+        noise = (self._rng.random((3, len(idx)), dtype=np.float32) * 2 - 1) * _NOISE_SCALE
+        temp, vib, pressure, codes = _sensor_step_impl()(temp, vib, pressure, noise[0], noise[1], noise[2])
 
-                self.iot_sensors[asset_id]['last_updated'] = datetime.now().isoformat()
+        # Simulate alerts
+        self._publish(idx, static, temp, vib, pressure, _STATUS_NAMES[codes])
 
-                # Simulate alerts
-                if self.iot_sensors[asset_id]['temperature'] > 75:
-                    self.assets[asset_id]['status'] = 'critical'
-                elif self.iot_sensors[asset_id]['temperature'] > 60:
-                    self.assets[asset_id]['status'] = 'warning'
-                else:
-                    self.assets[asset_id]['status'] = 'operational'
+    async def _run(self):
+        """Tick on the event loop at fixed deadlines so sleep jitter does not accumulate"""
+        if self._updated is None:
+            self._updated = asyncio.Event()
+        deadline = time.monotonic()
+        while self.running:
+            deadline += self.interval
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            if not self.running:
+                break
+            self._tick()
+            # Wake current waiters, then re-arm for the next tick
+            self._updated.set()
+            self._updated.clear()
 
-            time.sleep(5)  # Update every 5 seconds
+    def update_sensor_data(self):
+        """Simulate real-time sensor updates (thread fallback when no event loop is running)"""
+        deadline = time.monotonic()
+        while self.running:
+            deadline += self.interval
+            if self._stop.wait(max(0.0, deadline - time.monotonic())):
+                break
+            self._tick()
 
     def start_simulation(self):
-        """Start the real-time data simulation"""
+        """Start the real-time data simulation, on the running event loop if there is one"""
         if not self.running:
             self.running = True
-            self.thread = threading.Thread(target=self.update_sensor_data)
-            self.thread.daemon = True
-            self.thread.start()
+            self._stop.clear()
+            _sensor_step_impl()  # warm up the tick kernel before the first deadline
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.thread = threading.Thread(target=self.update_sensor_data)
+                self.thread.daemon = True
+                self.thread.start()
+            else:
+                self._task = loop.create_task(self._run())
 
     def stop_simulation(self):
         """Stop the simulation"""
         self.running = False
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
         if hasattr(self, 'thread'):
             self.thread.join()
 
@@ -108,21 +223,32 @@ class MaximoSimulator:
             }
         ]
 
+    @property
+    def work_orders(self) -> List[Dict[str, Any]]:
+        """All work orders, in insertion order"""
+        return list(self._by_id.values())
+
+    @work_orders.setter
+    def work_orders(self, work_orders: List[Dict[str, Any]]):
+        self._by_id = {}
+        self._by_asset = defaultdict(list)
+        for wo in work_orders:
+            self._by_id[wo['wo_id']] = wo
+            self._by_asset[wo['asset_id']].append(wo)
+
     def get_work_orders(self, asset_id: str = None) -> List[Dict[str, Any]]:
         """Get work orders, optionally filtered by asset"""
         if asset_id:
-            return [wo for wo in self.work_orders if wo['asset_id'] == asset_id]
+            return list(self._by_asset.get(asset_id, ()))
         return self.work_orders
 
     def link_document_to_work_order(self, doc_id: str, wo_id: str) -> bool:
         """Link a document to a work order"""
-        for wo in self.work_orders:
-            if wo['wo_id'] == wo_id:
-                if 'linked_documents' not in wo:
-                    wo['linked_documents'] = []
-                wo['linked_documents'].append(doc_id)
-                return True
-        return False
+        wo = self._by_id.get(wo_id)
+        if wo is None:
+            return False
+        wo.setdefault('linked_documents', []).append(doc_id)
+        return True
 
 class SharePointSimulator:
     """Simulates SharePoint integration for document management"""
@@ -140,9 +266,33 @@ class SharePointSimulator:
                 'metadata': {'department': 'Maintenance', 'type': 'manual'}
             }
         }
+        self._reindex()
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        return _WORD_RE.findall(text.lower())
+
+    def _reindex(self):
+        """Rebuild the token -> doc_id index; call after mutating self.documents"""
+        self._index = defaultdict(set)
+        # Results come back in self.documents order without walking every document
+        self._order = {doc_id: i for i, doc_id in enumerate(self.documents)}
+        for doc_id, doc_info in self.documents.items():
+            for token in self._tokens(doc_info['title']):
+                self._index[token].add(doc_id)
+            # Keys as well as values, like the substring scan over the metadata dict
+            for key, value in doc_info['metadata'].items():
+                for token in self._tokens(f"{key} {value}"):
+                    self._index[token].add(doc_id)
 
     def search_documents(self, query: str) -> List[Dict[str, Any]]:
         """Search documents in SharePoint"""
+        if _WORD_QUERY_RE.fullmatch(query):
+            postings = [self._index.get(token, set()) for token in self._tokens(query)]
+            hits = set.intersection(*postings) if postings else set()
+            return [{'doc_id': doc_id, **self.documents[doc_id]} for doc_id in sorted(hits, key=self._order.__getitem__)]
+
+        # Punctuation in the query: fall back to a substring scan
         results = []
         query_lower = query.lower()
         for doc_id, doc_info in self.documents.items():
@@ -1,31 +1,85 @@
 import io
 import os
+import re
+import mmap
 import hashlib
-from typing import Dict, Any, Tuple
+import threading
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Any, Optional, Tuple
 
-from langdetect import detect
-from PIL import Image
-try:
-    import pytesseract
-except Exception:
-    pytesseract = None
-from pypdf import PdfReader
-from docx import Document as DocxDocument
+from .settings import MAX_PDF_PAGES
 
 SUPPORTED_TYPES = (".pdf", ".docx", ".jpg", ".jpeg", ".png")
+TEXT_CACHE_SIZE = 256  # extracted texts and metadata memoised by file hash
+HASH_CHUNK_SIZE = 1 << 20
+
+# [0-9] instead of \d skips Unicode digit lookups; \b stays Unicode-aware so Malayalam
+# and accented letters still count as word characters next to a number
+_DATE_RE = re.compile(r"\b([0-9]{1,2}[\-/][0-9]{1,2}[\-/][0-9]{2,4}|[0-9]{4}-[0-9]{2}-[0-9]{2})\b")
+_AMOUNT_RE = re.compile(r"\b₹?\s?[0-9]{1,3}(?:,[0-9]{3})*(?:\.[0-9]+)?\b")
+_RISK_KEYS = ("risk", "hazard", "non-conform", "delay", "penalty")
+_MAX_BULLETS = 10
+_MAX_RISKS = 5
+
+_ML_RE = re.compile(r"[\u0D00-\u0D7F]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+_OTHER_LETTER_RE = re.compile(r"[^\W\d_A-Za-z\u0D00-\u0D7F]")
+_SCRIPT_MIN_CHARS = 20  # letters of both scripts needed to call a text bilingual
+
+# Document type keywords, highest priority first
+CATEGORIES = (
+    ("Procurement", ("purchase", "order", "invoice", "tender", "vendor", "procurement")),
+    ("Maintenance", ("maintenance", "work order", "job card", "asset", "repair", "inspection")),
+    ("Safety", ("safety", "incident", "near miss", "cmrs", "bulletin", "emergency", "evacuation")),
+    ("Engineering", ("drawing", "specification", "design", "engineering", "technical")),
+    ("HR", ("policy", "hr", "human resource", "leave", "recruitment", "staff")),
+    ("Regulatory", ("directive", "regulation", "ministry", "compliance", "regulatory")),
+    ("Operations", ("announcement", "passenger", "train", "station", "platform")),
+)
+
+
+def _open_stream(content):
+    """Readable stream over content; mmap views are already seekable files, so no copy."""
+    if isinstance(content, mmap.mmap):
+        content.seek(0)
+        return content
+    return io.BytesIO(content)
 
 
 class DocumentProcessor:
     """Lightweight processor with optional OCR for images.
     - PDF/DOCX: text extraction
     - Images: OCR if pytesseract is available
+    Content may be bytes or any read-only buffer (e.g. an mmap over an upload).
+    Passing the content's file hash lets repeated calls reuse the extracted text and metadata.
     """
 
+    def __init__(self) -> None:
+        self._text_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._meta_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _cache_get(self, cache: OrderedDict, key: str):
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _cache_put(self, cache: OrderedDict, key: str, value) -> None:
+        with self._cache_lock:
+            cache[key] = value
+            if len(cache) > TEXT_CACHE_SIZE:
+                cache.popitem(last=False)
+
+    # Parsers are imported on first use so startup only pays for the formats actually seen
     def _extract_text_pdf(self, content: bytes) -> str:
+        from pypdf import PdfReader
         try:
-            reader = PdfReader(io.BytesIO(content))
+            reader = PdfReader(_open_stream(content))
             texts = []
-            for page in reader.pages[:5]:  # limit for speed
+            for page in reader.pages[:MAX_PDF_PAGES]:  # limit for speed
                 t = page.extract_text() or ""
                 texts.append(t)
             return "\n".join(texts)
@@ -33,18 +87,22 @@ class DocumentProcessor:
             return ""
 
     def _extract_text_docx(self, content: bytes) -> str:
+        from docx import Document as DocxDocument
         try:
-            doc = DocxDocument(io.BytesIO(content))
+            doc = DocxDocument(_open_stream(content))
             return "\n".join(p.text for p in doc.paragraphs)
         except Exception:
             return ""
 
     def _extract_text_image(self, content: bytes) -> str:
+        from PIL import Image
         try:
-            img = Image.open(io.BytesIO(content)).convert("RGB")
+            img = Image.open(_open_stream(content)).convert("RGB")
         except Exception:
             return ""
-        if not pytesseract:
+        try:
+            import pytesseract
+        except Exception:
             return ""
         try:
             # OCR; if language packs not installed, defaults to eng
@@ -52,7 +110,17 @@ class DocumentProcessor:
         except Exception:
             return ""
 
-    def extract_fulltext(self, content: bytes, ext: str) -> str:
+    def extract_fulltext(self, content: bytes, ext: str, fhash: Optional[str] = None) -> str:
+        if fhash is None:
+            return self._extract_fulltext(content, ext)
+        key = f"{fhash}{ext.lower()}"
+        text = self._cache_get(self._text_cache, key)
+        if text is None:
+            text = self._extract_fulltext(content, ext)
+            self._cache_put(self._text_cache, key, text)
+        return text
+
+    def _extract_fulltext(self, content: bytes, ext: str) -> str:
         ext = ext.lower()
         if ext == ".pdf":
             return self._extract_text_pdf(content)
@@ -63,17 +131,37 @@ class DocumentProcessor:
         if ext == ".txt":
             # Handle plain text files
             try:
-                return content.decode('utf-8', errors='ignore')
+                return str(content, 'utf-8', errors='ignore')
             except:
                 return ""
         return ""
 
     def file_hash(self, content: bytes) -> str:
-        return hashlib.sha256(content).hexdigest()
+        return hashlib.sha256(memoryview(content)).hexdigest()
+
+    def file_hash_stream(self, fp) -> str:
+        """SHA-256 of a binary file object, read from its current position.
+        hashlib.file_digest picks its own buffering; HASH_CHUNK_SIZE only sizes the pre-3.11 fallback."""
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(fp, "sha256").hexdigest()
+        hasher = hashlib.sha256()
+        while block := fp.read(HASH_CHUNK_SIZE):
+            hasher.update(block)
+        return hasher.hexdigest()
 
-    def extract_metadata(self, filename: str, content: bytes) -> Dict[str, Any]:
+    def extract_metadata(self, filename: str, content: bytes, fhash: Optional[str] = None) -> Dict[str, Any]:
         ext = os.path.splitext(filename)[1].lower()
-        text = self.extract_fulltext(content, ext)
+        if fhash is None:
+            fhash = self.file_hash(content)
+        key = f"{fhash}{ext}"
+        meta = self._cache_get(self._meta_cache, key)
+        if meta is None:
+            meta = self._extract_metadata(ext, content, fhash)
+            self._cache_put(self._meta_cache, key, meta)
+        return dict(meta)
+
+    def _extract_metadata(self, ext: str, content: bytes, fhash: str) -> Dict[str, Any]:
+        text = self.extract_fulltext(content, ext, fhash)
 
         # Enhanced language detection for bilingual documents
         lang, is_bilingual = self._detect_language(text)
@@ -100,96 +188,71 @@ class DocumentProcessor:
         }
 
     def _detect_language(self, text: str) -> Tuple[str, bool]:
-        """Enhanced language detection for bilingual English-Malayalam documents"""
+        """Enhanced language detection for bilingual English-Malayalam documents.
+
+        Counts Malayalam and Latin letters in the sample; langdetect is only consulted
+        when neither script accounts for the text.
+        """
         if not text or len(text.strip()) < 10:
             return "unknown", False
 
-        sample = text.strip().replace("\n", " ")[:2000]  # Increased sample size
+        sample = text.strip()[:2000]
+        ml = len(_ML_RE.findall(sample))
+        en = len(_LATIN_RE.findall(sample))
+        if ml > _SCRIPT_MIN_CHARS and en > _SCRIPT_MIN_CHARS:
+            return "bilingual_en_ml", True
+        if ml > en:
+            return "malayalam", False
+        if en and en >= len(_OTHER_LETTER_RE.findall(sample)):
+            return "en", False
 
-        # Try to detect on the whole sample first
+        # Some other script (or no letters at all): let langdetect name it
         try:
-            primary_lang = detect(sample)
-            # Simple heuristic for Malayalam content
-            if 'malayalam' in sample.lower() or 'സുരക്ഷാ' in sample or 'യാത്രക്കാർക്ക്' in sample:
-                if primary_lang == 'en':
-                    return "bilingual_en_ml", True
-                else:
-                    return "malayalam", False
-            return primary_lang, False
-        except:
-            # Fallback to sentence-by-sentence detection
-            import re
-            sentences = re.split(r'[.!?]\s*', sample)
-            languages = []
-
-            for sentence in sentences[:5]:  # Check first 5 sentences
-                if sentence.strip() and len(sentence) > 20:
-                    try:
-                        lang = detect(sentence)
-                        languages.append(lang)
-                    except:
-                        continue
-
-            if not languages:
-                return "unknown", False
-
-            # Check for bilingual
-            has_english = 'en' in languages
-            has_malayalam = 'ml' in languages or any('malayalam' in lang.lower() for lang in languages)
-
-            if has_english and has_malayalam:
-                return "bilingual_en_ml", True
-            elif has_malayalam:
-                return "malayalam", False
-            elif has_english:
-                return "english", False
-            else:
-                return languages[0], False
+            from langdetect import detect
+            return detect(sample.replace("\n", " ")), False
+        except Exception:
+            return "unknown", False
 
     def _classify(self, text: str) -> str:
         if not text:
             return "Unknown"
         t = text.lower()
 
-        # More flexible keyword matching
-        if any(k in t for k in ["purchase", "order", "invoice", "tender", "vendor", "procurement"]):
-            return "Procurement"
-        if any(k in t for k in ["maintenance", "work order", "job card", "asset", "repair", "inspection"]):
-            return "Maintenance"
-        if any(k in t for k in ["safety", "incident", "near miss", "cmrs", "bulletin", "emergency", "evacuation"]):
-            return "Safety"
-        if any(k in t for k in ["drawing", "specification", "design", "engineering", "technical"]):
-            return "Engineering"
-        if any(k in t for k in ["policy", "hr", "human resource", "leave", "recruitment", "staff"]):
-            return "HR"
-        if any(k in t for k in ["directive", "regulation", "ministry", "compliance", "regulatory"]):
-            return "Regulatory"
-        if any(k in t for k in ["announcement", "passenger", "train", "station", "platform"]):
-            return "Operations"
+        # First category, in priority order, with any keyword in the text; str.__contains__ beats a regex here
+        for category, keywords in CATEGORIES:
+            if any(k in t for k in keywords):
+                return category
         return "General"
 
-    def quick_skim(self, content: bytes, meta: Dict[str, Any]) -> Dict[str, Any]:
-        """Produce actionable snippets without LLM: bullets, dates, amounts, risks (heuristics)."""
-        text = self.extract_fulltext(content, meta.get("ext", ""))
+    def quick_skim(self, content: bytes, meta: Dict[str, Any], fhash: Optional[str] = None,
+                   text: Optional[str] = None) -> Dict[str, Any]:
+        """Produce actionable snippets without LLM: bullets, dates, amounts, risks (heuristics).
 
-        # Extract simple cues
+        Pass ``text`` when the caller already extracted it to skip a second parse.
+        """
+        if text is None:
+            text = self.extract_fulltext(content, meta.get("ext", ""), fhash)
+        text = text or ""
+
+        # One pass over the lines collects both bullets and risk lines
         bullets = []
-        for line in (text or "").splitlines():
+        risks = []
+        for line in text.splitlines():
             ls = line.strip()
             if not ls:
                 continue
-            if ls[0] in "-•*" or ls[:2] in ("->", "=>"):
+            if len(bullets) < _MAX_BULLETS and (ls[0] in "-•*" or ls[:2] in ("->", "=>")):
                 bullets.append(ls[:200])
-        bullets = bullets[:10]
-
-        # Naive date/amount find
-        import re
-        dates = re.findall(r"\b(\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4}|\d{4}-\d{2}-\d{2})\b", text or "")[:10]
-        amounts = re.findall(r"\b₹?\s?\d{1,3}(?:,\d{3})*(?:\.\d+)?\b", text or "")[:10]
+            if len(risks) < _MAX_RISKS:
+                low = ls.lower()
+                if any(k in low for k in _RISK_KEYS):
+                    risks.append(ls[:200])
+            elif len(bullets) >= _MAX_BULLETS:
+                break
 
-        # Risks: look for key risk words
-        risks = [l.strip()[:200] for l in (text or "").splitlines() if any(k in l.lower() for k in ["risk", "hazard", "non-conform", "delay", "penalty"])]
-        risks = risks[:5]
+        # Naive date/amount find, stopping after the first 10 matches
+        dates = [m.group(1) for m in islice(_DATE_RE.finditer(text), 10)]
+        amounts = [m.group(0) for m in islice(_AMOUNT_RE.finditer(text), 10)]
 
         return {
             "bullets": bullets,
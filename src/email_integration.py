@@ -1,32 +1,146 @@
+import io
 import os
+import re
+import base64
+import quopri
+import shutil
 import smtplib
+import threading
+from collections import defaultdict
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Union
 import imaplib
-import email
+from email.parser import BytesHeaderParser
 from dotenv import load_dotenv
 
 load_dotenv()
 
+_UID_RE = re.compile(rb"UID (\d+)")
+_SEXPR_TOKEN_RE = re.compile(rb'\s*(\(|\)|"(?:[^"\\]|\\.)*"|\{\d+\}|[^\s()"]+)')
+_LITERAL_TAIL_RE = re.compile(rb"\{\d+\}$")
+
+
+def _response_lines(data):
+    """Whole response lines from imaplib FETCH data. A line carrying literals arrives as
+    (head ending in {n}, literal) tuples followed by the rest of the line; each literal
+    is put back inline as a quoted string so _parse_sexpr can read the line"""
+    line = b''
+    for item in data:
+        if isinstance(item, tuple):
+            head, literal = item
+            quoted = literal.replace(b'\\', b'\\\\').replace(b'"', b'\\"')
+            line += _LITERAL_TAIL_RE.sub(b'', head) + b'"' + quoted + b'"'
+        elif item is not None:
+            yield line + item
+            line = b''
+    if line:
+        yield line
+
+
+def _parse_sexpr(data: bytes):
+    """Parse one parenthesised IMAP list (e.g. a BODYSTRUCTURE) into nested lists of str/None"""
+    stack = [[]]
+    pos = 0
+    while True:
+        m = _SEXPR_TOKEN_RE.match(data, pos)
+        if m is None:
+            raise ValueError("unterminated IMAP list")
+        tok = m.group(1)
+        pos = m.end()
+        if tok == b'(':
+            stack.append([])
+        elif tok == b')':
+            done = stack.pop()
+            if not stack:
+                raise ValueError("unbalanced IMAP list")
+            stack[-1].append(done)
+            if len(stack) == 1:
+                return done
+        elif tok.startswith(b'{'):
+            raise ValueError("literal inside IMAP list")
+        elif tok.startswith(b'"'):
+            stack[-1].append(re.sub(rb'\\(.)', rb'\1', tok[1:-1]).decode('utf-8', errors='ignore'))
+        elif tok.upper() == b'NIL':
+            stack[-1].append(None)
+        else:
+            stack[-1].append(tok.decode('ascii', errors='ignore'))
+
+
+def _lower(value) -> str:
+    return value.lower() if isinstance(value, str) else ''
+
+
+def _params(value) -> Dict[str, str]:
+    if not isinstance(value, list):
+        return {}
+    return {_lower(k): v for k, v in zip(value[::2], value[1::2])}
+
+
+def _part_filename(leaf):
+    """Filename of an attachment leaf: needs a Content-Disposition, like the old MIME walk"""
+    disposition = next((x for x in leaf[7:] if isinstance(x, list) and x and isinstance(x[0], str)
+                        and _lower(x[0]) in ('attachment', 'inline')), None)
+    if disposition is None:
+        return None
+    return _params(disposition[1] if len(disposition) > 1 else None).get('filename') or _params(leaf[2]).get('name')
+
+
+def _transfer_decode(raw: bytes, leaf) -> bytes:
+    encoding = _lower(leaf[5]) if len(leaf) > 5 else ''
+    if encoding == 'base64':
+        return base64.b64decode(raw)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(raw)
+    return raw
+
+
+def _decode_part(raw: bytes, leaf) -> str:
+    return _transfer_decode(raw, leaf).decode('utf-8', errors='ignore')
+
 class EmailIntegration:
     def __init__(self):
+        self._imap_conn = None
+        # Held across each select -> search -> fetch sequence on the pooled connection (close() re-enters)
+        self._imap_lock = threading.RLock()
+        self._smtp = None
+        # One SMTP conversation at a time: concurrent callers would interleave MAIL/RCPT/DATA on the socket
+        self._smtp_lock = threading.Lock()
         self.smtp_server = os.getenv('GMAIL_SMTP_SERVER', 'smtp.gmail.com')
         self.smtp_port = int(os.getenv('GMAIL_SMTP_PORT', 587))
         self.username = os.getenv('GMAIL_USERNAME')
         self.password = os.getenv('GMAIL_PASSWORD')
         self.email_ready = all([self.username, self.password])
 
-    def send_notification(self, to_email: str, subject: str, body: str, attachments: List[str] = None):
-        """Send email notification about processed documents"""
-        if not self.email_ready:
-            return {"status": "error", "message": "Email not configured"}
+    def _smtp_session(self) -> smtplib.SMTP:
+        """Logged-in SMTP session, reused across sends while the server keeps it open (hold _smtp_lock)"""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except smtplib.SMTPException:
+                pass
+            self._close_smtp()
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        server.starttls()
+        server.login(self.username, self.password)
+        self._smtp = server
+        return server
 
+    def _close_smtp(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _build_message(self, to_emails: List[str], subject: str, body: str, attachments: List[str] = None) -> MIMEMultipart:
         msg = MIMEMultipart()
         msg['From'] = self.username
-        msg['To'] = to_email
+        msg['To'] = ', '.join(to_emails)
         msg['Subject'] = subject
 
         msg.attach(MIMEText(body, 'html'))
@@ -40,77 +154,192 @@ class EmailIntegration:
                         encoders.encode_base64(part)
                         part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment)}')
                         msg.attach(part)
+        return msg
+
+    def send_bulk(self, messages: List[Tuple[List[str], MIMEMultipart]]) -> None:
+        """Send several messages over one SMTP session, reconnecting once if it was dropped"""
+        pending = list(messages)
+        retried = False
+        with self._smtp_lock:
+            while pending:
+                rcpts, msg = pending[0]
+                try:
+                    self._smtp_session().send_message(msg, from_addr=self.username, to_addrs=rcpts)
+                except smtplib.SMTPServerDisconnected:
+                    self._smtp = None
+                    if retried:
+                        raise
+                    retried = True
+                    continue
+                pending.pop(0)
+
+    def send_notification(self, to_emails: Union[str, List[str]], subject: str, body: str, attachments: List[str] = None):
+        """Send email notification about processed documents"""
+        if not self.email_ready:
+            return {"status": "error", "message": "Email not configured"}
+
+        if isinstance(to_emails, str):
+            to_emails = [e.strip() for e in to_emails.split(',') if e.strip()]
+        if not to_emails:
+            return {"status": "error", "message": "No recipients"}
 
         try:
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.username, self.password)
-            text = msg.as_string()
-            server.sendmail(self.username, to_email, text)
-            server.quit()
-            return {"status": "success", "message": f"Email sent to {to_email}"}
+            # One message, one RCPT TO per recipient
+            self.send_bulk([(to_emails, self._build_message(to_emails, subject, body, attachments))])
+            return {"status": "success", "message": f"Email sent to {', '.join(to_emails)}"}
         except Exception as e:
+            with self._smtp_lock:
+                self._close_smtp()
             return {"status": "error", "message": str(e)}
 
-    def fetch_emails(self, folder: str = 'INBOX', limit: int = 10) -> List[Dict[str, Any]]:
-        """Fetch recent emails for document ingestion"""
+    def _imap(self):
+        """Logged-in IMAP connection, reused across calls while the server keeps it alive (hold _imap_lock)"""
+        if self._imap_conn is not None:
+            try:
+                self._imap_conn.noop()
+                return self._imap_conn
+            except Exception:
+                self._imap_conn = None
+        mail = imaplib.IMAP4_SSL('imap.gmail.com')
+        mail.login(self.username, self.password)
+        self._imap_conn = mail
+        return mail
+
+    def close(self):
+        """Log out of the pooled IMAP connection"""
+        with self._imap_lock:
+            if self._imap_conn is not None:
+                try:
+                    self._imap_conn.logout()
+                except Exception:
+                    pass
+                self._imap_conn = None
+
+    def fetch_emails(self, folder: str = 'INBOX', limit: int = 10, want_attachments: bool = False) -> List[Dict[str, Any]]:
+        """Fetch recent emails for document ingestion.
+
+        Only headers, BODYSTRUCTURE and the plain-text part are downloaded; attachment
+        parts are pulled (and saved) only when want_attachments is set.
+        """
         if not self.email_ready:
             return []
 
-        try:
-            mail = imaplib.IMAP4_SSL('imap.gmail.com')
-            mail.login(self.username, self.password)
-            mail.select(folder)
-
-            status, messages = mail.search(None, 'ALL')
-            email_ids = messages[0].split()[-limit:] if messages[0] else []
-
-            emails = []
-            for email_id in email_ids:
-                status, msg_data = mail.fetch(email_id, '(RFC822)')
-                raw_email = msg_data[0][1]
-                email_message = email.message_from_bytes(raw_email)
-
-                email_data = {
-                    'subject': email_message['Subject'],
-                    'from': email_message['From'],
-                    'date': email_message['Date'],
-                    'body': self._get_email_body(email_message),
-                    'attachments': self._get_attachments(email_message)
-                }
-                emails.append(email_data)
-
-            mail.logout()
-            return emails
-        except Exception as e:
-            print(f"Email fetch error: {e}")
-            return []
+        with self._imap_lock:
+            try:
+                mail = self._imap()
+                mail.select(folder, readonly=True)
+
+                status, messages = mail.uid('SEARCH', None, 'ALL')
+                uids = [u.decode() for u in messages[0].split()[-limit:]] if messages[0] else []
+                if not uids:
+                    return []
+
+                structures = self._fetch_structures(mail, uids)
+                headers = self._fetch_sections(mail, uids, 'HEADER')
+                parser = BytesHeaderParser()
+
+                # Batch the body fetch by section so typical mailboxes need one or two round trips
+                by_section = defaultdict(list)
+                for uid in uids:
+                    leaf = self._text_part(structures.get(uid))
+                    if leaf is not None:
+                        by_section[leaf[0]].append(uid)
+                bodies = {}
+                for section, section_uids in by_section.items():
+                    for uid, raw in self._fetch_sections(mail, section_uids, section).items():
+                        bodies[uid] = _decode_part(raw, self._text_part(structures[uid])[1])
+
+                emails = []
+                for uid in uids:
+                    header = parser.parsebytes(headers.get(uid, b''))
+                    email_data = {
+                        'subject': header['Subject'],
+                        'from': header['From'],
+                        'date': header['Date'],
+                        'body': bodies.get(uid, ''),
+                        'attachments': self._get_attachments(mail, uid, structures.get(uid)) if want_attachments else []
+                    }
+                    emails.append(email_data)
+                return emails
+            except Exception as e:
+                print(f"Email fetch error: {e}")
+                self.close()
+                return []
 
-    def _get_email_body(self, email_message):
-        """Extract plain text body from email"""
-        if email_message.is_multipart():
-            for part in email_message.walk():
-                if part.get_content_type() == 'text/plain':
-                    return part.get_payload(decode=True).decode('utf-8', errors='ignore')
+    def _fetch_structures(self, mail, uids: List[str]) -> Dict[str, Any]:
+        status, data = mail.uid('FETCH', ','.join(uids), '(UID BODYSTRUCTURE)')
+        structures = {}
+        for item in _response_lines(data):
+            m = _UID_RE.search(item)
+            start = item.find(b'BODYSTRUCTURE ')
+            if m is None or start < 0:
+                continue
+            try:
+                structures[m.group(1).decode()] = _parse_sexpr(item[start + len(b'BODYSTRUCTURE '):])
+            except ValueError:
+                continue
+        return structures
+
+    def _fetch_sections(self, mail, uids: List[str], section: str) -> Dict[str, bytes]:
+        status, data = mail.uid('FETCH', ','.join(uids), f'(UID BODY.PEEK[{section}])')
+        sections = {}
+        pending = None
+        for item in data:
+            if isinstance(item, tuple):
+                m = _UID_RE.search(item[0])
+                if m is not None:
+                    sections[m.group(1).decode()] = item[1]
+                else:
+                    pending = item[1]
+            elif pending is not None and item:
+                # Some servers send the UID after the literal
+                m = _UID_RE.search(item)
+                if m is not None:
+                    sections[m.group(1).decode()] = pending
+                pending = None
+        return sections
+
+    @staticmethod
+    def _leaves(structure, path=''):
+        """(section, leaf) pairs of a BODYSTRUCTURE in depth-first order"""
+        if structure and isinstance(structure[0], list):
+            n = 0
+            for child in structure:
+                if not isinstance(child, list):
+                    break
+                n += 1
+                yield from EmailIntegration._leaves(child, f"{path}.{n}" if path else str(n))
         else:
-            return email_message.get_payload(decode=True).decode('utf-8', errors='ignore')
-        return ""
+            yield path or '1', structure
+
+    def _text_part(self, structure):
+        """Section of the body to show: a single-part message itself, else the first text/plain part"""
+        if not structure:
+            return None
+        if not isinstance(structure[0], list):
+            return '1', structure
+        for section, leaf in self._leaves(structure):
+            if _lower(leaf[0]) == 'text' and _lower(leaf[1]) == 'plain':
+                return section, leaf
+        return None
 
-    def _get_attachments(self, email_message) -> List[str]:
-        """Extract attachments and save them temporarily"""
+    def _get_attachments(self, mail, uid: str, structure) -> List[str]:
+        """Fetch attachment parts and save them temporarily"""
         attachments = []
-        for part in email_message.walk():
-            if part.get_content_maintype() == 'multipart':
+        if not structure or not isinstance(structure[0], list):
+            return attachments
+        for section, leaf in self._leaves(structure):
+            filename = _part_filename(leaf)
+            if not filename:
                 continue
-            if part.get('Content-Disposition') is None:
+            raw = self._fetch_sections(mail, [uid], section).get(uid)
+            if raw is None:
                 continue
-            filename = part.get_filename()
-            if filename:
-                filepath = os.path.join('temp_attachments', filename)
-                os.makedirs('temp_attachments', exist_ok=True)
-                with open(filepath, 'wb') as f:
-                    f.write(part.get_payload(decode=True))
-                attachments.append(filepath)
+            filepath = os.path.join('temp_attachments', os.path.basename(filename))
+            os.makedirs('temp_attachments', exist_ok=True)
+            with open(filepath, 'wb') as f:
+                shutil.copyfileobj(io.BytesIO(_transfer_decode(raw, leaf)), f, length=1 << 20)
+            attachments.append(filepath)
         return attachments
 
     def route_document(self, document_data: Dict[str, Any], recipients: List[str]):
@@ -124,4 +353,4 @@ class EmailIntegration:
         <p>Please review the attached analysis.</p>
         """
         # In a real implementation, attach the processed document
-        return self.send_notification(','.join(recipients), subject, body)
\ No newline at end of file
+        return self.send_notification(list(recipients), subject, body)
\ No newline at end of file
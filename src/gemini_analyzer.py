@@ -1,10 +1,16 @@
+import io
 import os
-from typing import Dict, Any
+import time
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
 
-try:
-    import google.generativeai as genai
-except Exception:
-    genai = None
+IMAGE_MAX_SIDE = 1024  # images are downscaled to this long side before upload
+UPLOAD_CACHE_SIZE = 256
+UPLOAD_TTL = 47 * 3600  # the File API deletes uploads after 48 hours
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
 
 
 class GeminiUnavailable(Exception):
@@ -14,13 +20,64 @@ class GeminiUnavailable(Exception):
 class GeminiAnalyzer:
     def __init__(self):
         api_key = os.getenv("GOOGLE_API_KEY")
+        genai = None
+        if api_key:
+            # Heavy SDK import, only paid when Gemini is actually configured
+            try:
+                import google.generativeai as genai
+            except Exception:
+                genai = None
         if not api_key or not genai:
             raise GeminiUnavailable("Gemini not available: missing key or package")
         genai.configure(api_key=api_key)
         # Use 2.5 Flash as requested
         self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self._genai = genai
+        # content hash -> (uploaded File, uploaded_at)
+        self._upload_cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._upload_lock = threading.Lock()
 
-    def analyze_document(self, file_content: bytes, role: str = "manager") -> Dict[str, Any]:
+    def _shrink_image(self, file_content) -> Optional[bytes]:
+        """JPEG re-encode with the long side capped at IMAGE_MAX_SIDE, or None if not decodable."""
+        from PIL import Image
+        try:
+            img = Image.open(io.BytesIO(file_content)).convert("RGB")
+            img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=85)
+            return out.getvalue()
+        except Exception:
+            return None
+
+    def _uploaded_file(self, file_content, fhash: Optional[str], ext: str):
+        """Upload through the File API once per content hash and reuse the handle."""
+        if fhash is None:
+            fhash = hashlib.sha256(file_content).hexdigest()
+        now = time.monotonic()
+        with self._upload_lock:
+            hit = self._upload_cache.get(fhash)
+            if hit is not None and now - hit[1] < UPLOAD_TTL:
+                self._upload_cache.move_to_end(fhash)
+                return hit[0]
+
+        data = None
+        mime_type = mimetypes.types_map.get(ext, "application/octet-stream")
+        if ext in IMAGE_EXTS:
+            data = self._shrink_image(file_content)
+            if data is not None:
+                mime_type = "image/jpeg"
+        if data is None:
+            data = bytes(file_content)
+        uploaded = self._genai.upload_file(io.BytesIO(data), mime_type=mime_type)
+
+        with self._upload_lock:
+            self._upload_cache[fhash] = (uploaded, now)
+            if len(self._upload_cache) > UPLOAD_CACHE_SIZE:
+                self._upload_cache.popitem(last=False)
+        return uploaded
+
+    def analyze_document(self, file_content: bytes, role: str = "manager",
+                         fhash: Optional[str] = None, ext: str = "") -> Dict[str, Any]:
         prompt = f"""
         You are an assistant for Kochi Metro Rail Limited (KMRL). Analyze the uploaded document and return a concise, role-specific JSON with fields:
         - classification (Engineering/Safety/Procurement/HR/Regulatory/Finance/General)
@@ -31,11 +88,12 @@ class GeminiAnalyzer:
         - summary (5-7 bullet points tailored for {role})
         Ensure valid JSON only.
         """
-        # Send as bytes
-        resp = self.model.generate_content([
-            {"text": prompt},
-            {"inline_data": {"mime_type": "application/octet-stream", "data": file_content}}
-        ])
+        try:
+            document = self._uploaded_file(file_content, fhash, ext.lower())
+        except Exception:
+            # File API unavailable: send inline as before (callers may hand us an mmap/memoryview)
+            document = {"inline_data": {"mime_type": "application/octet-stream", "data": bytes(file_content)}}
+        resp = self.model.generate_content([{"text": prompt}, document])
         text = resp.text or "{}"
         # Best-effort JSON parse
         import json
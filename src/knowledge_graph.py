@@ -1,58 +1,157 @@
-from typing import List, Dict, Any, Tuple
-import plotly.graph_objects as go
-import networkx as nx
+import hashlib
+from functools import lru_cache
+from typing import List, Dict, Any, Set, Tuple
+import numpy as np
+
+CIRCULAR_LAYOUT_MAX_NODES = 40  # small graphs are simply placed on a circle
+LAYOUT_ITERATIONS = 50
+LAYOUT_SEED = 42
+
+
+def _fr_step_numpy(pos, edges, k, t):
+    """One Fruchterman-Reingold step over all node pairs at once."""
+    delta = pos[:, None, :] - pos[None, :, :]
+    dist2 = np.maximum((delta ** 2).sum(-1), 1e-4)
+    disp = (delta * (k * k / dist2)[:, :, None]).sum(1)
+    if len(edges):
+        d = pos[edges[:, 0]] - pos[edges[:, 1]]
+        f = d * (np.sqrt((d ** 2).sum(-1)) / k)[:, None]
+        np.subtract.at(disp, edges[:, 0], f)
+        np.add.at(disp, edges[:, 1], f)
+    length = np.maximum(np.sqrt((disp ** 2).sum(-1)), 1e-2)
+    pos += disp * (np.minimum(length, t) / length)[:, None]
+
+
+@lru_cache(maxsize=None)
+def _fr_step_impl():
+    """Layout step kernel: numba-compiled when numba is installed, imported on first large layout."""
+    try:
+        from numba import njit, prange
+    except Exception:
+        return _fr_step_numpy
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _fr_step(pos, edges, k, t):
+        n = pos.shape[0]
+        disp = np.zeros_like(pos)
+        for i in prange(n):
+            dx = np.float32(0.0)
+            dy = np.float32(0.0)
+            for j in range(n):
+                ox = pos[i, 0] - pos[j, 0]
+                oy = pos[i, 1] - pos[j, 1]
+                d2 = max(ox * ox + oy * oy, 1e-4)
+                dx += ox * k * k / d2
+                dy += oy * k * k / d2
+            disp[i, 0] = dx
+            disp[i, 1] = dy
+        for e in range(edges.shape[0]):
+            a, b = edges[e, 0], edges[e, 1]
+            ox = pos[a, 0] - pos[b, 0]
+            oy = pos[a, 1] - pos[b, 1]
+            d = np.sqrt(ox * ox + oy * oy) / k
+            disp[a, 0] -= ox * d
+            disp[a, 1] -= oy * d
+            disp[b, 0] += ox * d
+            disp[b, 1] += oy * d
+        for i in prange(n):
+            length = max(np.sqrt(disp[i, 0] ** 2 + disp[i, 1] ** 2), 1e-2)
+            step = min(length, t) / length
+            pos[i, 0] += disp[i, 0] * step
+            pos[i, 1] += disp[i, 1] * step
+
+    return _fr_step
+
+
+def _layout(n: int, edges: np.ndarray) -> np.ndarray:
+    """Node positions as float32[n, 2]: a circle for small graphs, force-directed otherwise."""
+    if n <= CIRCULAR_LAYOUT_MAX_NODES:
+        theta = np.linspace(0, 2 * np.pi, n, endpoint=False)
+        return np.column_stack((np.cos(theta), np.sin(theta))).astype(np.float32)
+    pos = np.random.default_rng(LAYOUT_SEED).random((n, 2), dtype=np.float32)
+    k = np.float32(1.0 / np.sqrt(n))
+    t = 0.1
+    _fr_step = _fr_step_impl()
+    for i in range(LAYOUT_ITERATIONS):
+        _fr_step(pos, edges, k, np.float32(t * (1 - i / LAYOUT_ITERATIONS)))
+    return pos
 
 
 class KnowledgeGraphGenerator:
-    def build_from_document(self, meta: Dict[str, Any], quick: Dict[str, Any], llm: Dict[str, Any] | None) -> Tuple[List[Dict], List[Dict]]:
+    def build_from_document(self, meta: Dict[str, Any], quick: Dict[str, Any], llm: Dict[str, Any] | None,
+                            seen: Set[Any] | None = None) -> Tuple[List[Dict], List[Dict]]:
+        """Nodes/edges for one document. Pass the same ``seen`` set across documents to
+        skip nodes and edges already emitted for earlier ones."""
         nodes: List[Dict] = []
         edges: List[Dict] = []
+        if seen is None:
+            seen = set()
+
+        def add_node(node: Dict[str, Any]) -> None:
+            if node["id"] not in seen:
+                seen.add(node["id"])
+                nodes.append(node)
+
+        def add_edge(source: str, target: str, label: str) -> None:
+            key = (source, target, label)
+            if key not in seen:
+                seen.add(key)
+                edges.append({"source": source, "target": target, "label": label})
 
         # Root node per document type
         doc_node = {"id": f"doc:{meta.get('doc_type','Unknown')}", "label": meta.get('doc_type','Unknown'), "group": "doc_type"}
-        nodes.append(doc_node)
+        add_node(doc_node)
 
         # Entities from quick + llm
         for ent in (llm.get("key_entities", []) if llm else []):
-            nodes.append({"id": f"ent:{ent}", "label": ent, "group": "entity"})
-            edges.append({"source": doc_node["id"], "target": f"ent:{ent}", "label": "mentions"})
+            add_node({"id": f"ent:{ent}", "label": ent, "group": "entity"})
+            add_edge(doc_node["id"], f"ent:{ent}", "mentions")
 
         for risk in quick.get("risks", []):
-            rid = f"risk:{hash(risk)}"
-            nodes.append({"id": rid, "label": risk[:30] + ("…" if len(risk) > 30 else ""), "group": "risk"})
-            edges.append({"source": doc_node["id"], "target": rid, "label": "risk"})
+            # Stable across processes, unlike hash()
+            rid = f"risk:{hashlib.blake2b(risk.encode('utf-8'), digest_size=8).hexdigest()}"
+            add_node({"id": rid, "label": risk[:30] + ("…" if len(risk) > 30 else ""), "group": "risk"})
+            add_edge(doc_node["id"], rid, "risk")
 
         for dt in quick.get("dates", []):
             did = f"date:{dt}"
-            nodes.append({"id": did, "label": dt, "group": "date"})
-            edges.append({"source": doc_node["id"], "target": did, "label": "date"})
+            add_node({"id": did, "label": dt, "group": "date"})
+            add_edge(doc_node["id"], did, "date")
 
         return nodes, edges
 
     def to_plotly(self, nodes: List[Dict], edges: List[Dict]):
-        G = nx.Graph()
+        import plotly.graph_objects as go
+
+        # Same merging as an undirected graph: one node per id (last attributes win), one edge per pair
+        labels: Dict[str, Any] = {}
         for n in nodes:
-            G.add_node(n["id"], **n)
+            labels[n["id"]] = n.get("label", n["id"])
+        index: Dict[str, int] = {}
+        for node_id in labels:
+            index[node_id] = len(index)
+        pairs = {}
         for e in edges:
-            G.add_edge(e["source"], e["target"], **e)
-
-        pos = nx.spring_layout(G, k=0.6, seed=42)
+            for end in (e["source"], e["target"]):
+                if end not in index:
+                    index[end] = len(index)
+                    labels[end] = end
+            a, b = index[e["source"]], index[e["target"]]
+            pairs.setdefault((min(a, b), max(a, b)), None)
+        edge_idx = np.array(list(pairs), dtype=np.int32).reshape(-1, 2)
 
-        x_nodes = [pos[n][0] for n in G.nodes()]
-        y_nodes = [pos[n][1] for n in G.nodes()]
-        text_nodes = [G.nodes[n].get("label", n) for n in G.nodes()]
+        pos = _layout(len(index), edge_idx)
+        x_nodes, y_nodes = pos[:, 0], pos[:, 1]
+        text_nodes = list(labels.values())
 
-        edge_x = []
-        edge_y = []
-        for u, v in G.edges():
-            x0, y0 = pos[u]
-            x1, y1 = pos[v]
-            edge_x += [x0, x1, None]
-            edge_y += [y0, y1, None]
+        # x0, x1, NaN per edge; the NaN breaks the line between segments
+        gap = np.full(len(edge_idx), np.nan, dtype=np.float32)
+        edge_x = np.column_stack((x_nodes[edge_idx[:, 0]], x_nodes[edge_idx[:, 1]], gap)).ravel()
+        edge_y = np.column_stack((y_nodes[edge_idx[:, 0]], y_nodes[edge_idx[:, 1]], gap)).ravel()
 
         fig = go.Figure()
-        fig.add_trace(go.Scatter(x=edge_x, y=edge_y, mode='lines', line=dict(width=1, color='#aaa')))
-        fig.add_trace(go.Scatter(x=x_nodes, y=y_nodes, mode='markers+text', text=text_nodes, textposition='top center',
-                                 marker=dict(size=10, color='#1f77b4')))
+        fig.add_trace(go.Scattergl(x=edge_x, y=edge_y, mode='lines', line=dict(width=1, color='#aaa')))
+        fig.add_trace(go.Scattergl(x=x_nodes, y=y_nodes, mode='markers+text', text=text_nodes, textposition='top center',
+                                   marker=dict(size=10, color='#1f77b4')))
         fig.update_layout(margin=dict(l=10, r=10, t=10, b=10))
-        return fig
\ No newline at end of file
+        return fig
@@ -3,7 +3,7 @@ from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Metadata:
     ext: str
     language: str
@@ -12,7 +12,7 @@ class Metadata:
     char_count: int
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class QuickView:
     bullets: List[str] = field(default_factory=list)
     dates: List[str] = field(default_factory=list)
@@ -20,7 +20,7 @@ class QuickView:
     risks: List[str] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class LLMAnalysis:
     classification: Optional[str] = None
     key_entities: List[str] = field(default_factory=list)
@@ -32,14 +32,14 @@ class LLMAnalysis:
     error: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ComplianceFlag:
     id: str
     message: str
     severity: str
 
 
-@dataclass
+@dataclass(slots=True)
 class DocRecord:
     filename: str
     file_hash: str
@@ -0,0 +1,18 @@
+import bcrypt
+
+from .settings import settings
+
+# bcrypt only looks at the first 72 bytes; truncate explicitly like passlib did
+_BCRYPT_MAX_BYTES = 72
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(plain_password.encode("utf-8")[:_BCRYPT_MAX_BYTES], hashed_password.encode("utf-8"))
+    except ValueError:  # unrecognised or malformed hash
+        return False
+
+
+def get_password_hash(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=settings.bcrypt_rounds)
+    return bcrypt.hashpw(password.encode("utf-8")[:_BCRYPT_MAX_BYTES], salt).decode("ascii")
@@ -1,20 +1,59 @@
 import os
-from typing import Optional
+from dataclasses import dataclass
+from typing import Mapping, Optional
 
+try:
+    from dotenv import load_dotenv
+except Exception:
+    load_dotenv = None
 
+
+def _int(env: Mapping[str, str], name: str, default: int) -> int:
+    raw = env.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {raw!r}") from None
+
+
+@dataclass(frozen=True, slots=True)
 class Settings:
     """Centralized app settings loaded from environment (.env supported)."""
 
-    def __init__(self) -> None:
-        self.google_api_key: Optional[str] = os.getenv("GOOGLE_API_KEY")
-        # Where to place SQLite DB; defaults to data/docsense.db under project
-        self.storage_path: str = os.getenv("DS_STORAGE_PATH", "data/docsense.db")
-        # Max PDF pages to read during quick skim
-        self.max_pdf_pages: int = int(os.getenv("DS_MAX_PDF_PAGES", "5"))
-        # Default analyzer provider: none|gemini
-        self.default_analyzer: str = os.getenv("DS_ANALYZER", "gemini" if self.google_api_key else "none")
-        # LLM request timeout (seconds)
-        self.llm_timeout: int = int(os.getenv("DS_LLM_TIMEOUT", "45"))
+    google_api_key: Optional[str]
+    # Where to place SQLite DB; defaults to data/docsense.db under project
+    storage_path: str
+    # Max PDF pages to read during quick skim
+    max_pdf_pages: int
+    # Default analyzer provider: none|gemini
+    default_analyzer: str
+    # LLM request timeout (seconds)
+    llm_timeout: int
+    # bcrypt cost factor for password hashes (each +1 doubles hashing time)
+    bcrypt_rounds: int
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "Settings":
+        """Parse settings from one snapshot of the environment."""
+        env = dict(os.environ if env is None else env)
+        google_api_key = env.get("GOOGLE_API_KEY")
+        return cls(
+            google_api_key=google_api_key,
+            storage_path=env.get("DS_STORAGE_PATH", "data/docsense.db"),
+            max_pdf_pages=_int(env, "DS_MAX_PDF_PAGES", 5),
+            default_analyzer=env.get("DS_ANALYZER", "gemini" if google_api_key else "none"),
+            llm_timeout=_int(env, "DS_LLM_TIMEOUT", 45),
+            bcrypt_rounds=_int(env, "DS_BCRYPT_ROUNDS", 12),
+        )
+
 
+# .env has to reach os.environ before the snapshot; entry points import src.* before their own load_dotenv()
+if load_dotenv is not None:
+    load_dotenv()
+settings = Settings.from_env()
 
-settings = Settings()
\ No newline at end of file
+# Plain module constants for hot paths
+MAX_PDF_PAGES = settings.max_pdf_pages
+LLM_TIMEOUT = settings.llm_timeout
@@ -1,29 +1,306 @@
 import os
 import json
+import atexit
 import sqlite3
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence
+
+from .security import verify_password
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+
+def _dumps(obj: Any) -> bytes:
+    """UTF-8 JSON for a BLOB column; orjson when installed, stdlib otherwise."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. ints beyond 64 bits; stdlib copes
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+# Accepts bytes (BLOB rows) as well as str (rows written as TEXT by older versions)
+_loads = orjson.loads if orjson is not None else json.loads
+
+try:
+    import cysimdjson
+except Exception:
+    cysimdjson = None
+
+_MISSING = object()
+
+_clock = (-1, "")  # (second, formatted up to the second), shared by all threads
+
+
+def _utc_now() -> str:
+    """UTC ISO-8601 timestamp with microseconds, as datetime.utcnow().isoformat() gives.
+    The date/time part is formatted once per second."""
+    global _clock
+    us = time.time_ns() // 1000
+    second, prefix = _clock
+    if us // 1_000_000 != second:
+        second = us // 1_000_000
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _clock = (second, prefix)
+    return f"{prefix}.{us % 1_000_000:06d}"
+
+
+def _pick(parser, raw: Optional[bytes], pointers: List[str]) -> Dict[str, Any]:
+    """Only the requested top-level keys of a JSON column, without decoding the rest."""
+    if not raw:
+        return {}
+    out: Dict[str, Any] = {}
+    if parser is not None:
+        doc = parser.parse(raw)
+        for key in pointers:
+            try:
+                value = doc.at_pointer("/" + key.replace("~", "~0").replace("/", "~1"))
+            except (KeyError, TypeError, ValueError):
+                continue  # missing key, or the blob is not an object
+            out[key] = value.export() if hasattr(value, "export") else value
+        return out
+    obj = _loads(raw)
+    if isinstance(obj, dict):
+        for key in pointers:
+            value = obj.get(key, _MISSING)
+            if value is not _MISSING:
+                out[key] = value
+    return out
+
+# User lookups are served from memory; create_user() invalidates them, the TTL covers
+# users created by other processes (e.g. setup.py)
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 5.0
+# search() results, dropped whenever this process saves a document (TTL as above)
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTL = 5.0
+# Refresh planner statistics after this many saves (PRAGMA optimize also runs on close)
+ANALYZE_EVERY = 1000
+
+# Applied once to every new connection
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA busy_timeout=5000",
+)
+# The search index lives in its own file (attached as "fts") with its own WAL,
+# so bulk text indexing and checkpoints don't stall the small-row writes
+FTS_PRAGMAS = (
+    "PRAGMA fts.journal_mode=WAL",
+    "PRAGMA fts.synchronous=NORMAL",
+)
+
+# Hot statements, passed verbatim so sqlite3's per-connection statement cache reuses them
+STATEMENT_CACHE_SIZE = 256
+# New hash: insert; known hash: keep the stored row (the no-op update leaves indexed columns alone).
+# Either way the id comes back from the same statement.
+_SQL_UPSERT_DOC = """
+    INSERT INTO documents(filename, file_hash, ext, language, doc_type, role, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(file_hash) DO UPDATE SET file_hash = excluded.file_hash
+    RETURNING id
+"""
+# Re-saving a document overwrites its analysis row in place (unique index on doc_id)
+_SQL_UPSERT_ANALYSIS = """
+    INSERT INTO analyses(doc_id, quick, llm, compliance) VALUES (?, ?, ?, ?)
+    ON CONFLICT(doc_id) DO UPDATE SET quick = excluded.quick, llm = excluded.llm, compliance = excluded.compliance
+"""
+# Full text per document, keyed by documents.id (FTS5 external content must share its database).
+# Only the text: filename, doc_type and language stay on documents and are joined in
+_SQL_CREATE_DOC_TEXT = """
+    CREATE TABLE IF NOT EXISTS fts.doc_text (
+        id INTEGER PRIMARY KEY,
+        content TEXT
+    )
+"""
+# A re-saved hash is ignored: its text is already stored and indexed
+_SQL_INSERT_DOC_TEXT = "INSERT OR IGNORE INTO fts.doc_text(id, content) VALUES (?, ?)"
+# docs_fts is an external-content index over doc_text: it stores tokens only
+_SQL_CREATE_FTS = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS fts.docs_fts USING fts5(
+        content,
+        content='doc_text',
+        content_rowid='id'
+    )
+"""
+# Index text as it is inserted (ignored duplicates don't fire it)
+_SQL_CREATE_FTS_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS fts.doc_text_index AFTER INSERT ON doc_text BEGIN
+        INSERT INTO docs_fts(rowid, content) VALUES (new.id, new.content);
+    END
+"""
+_SQL_RECENT = """
+    SELECT d.id, d.filename, d.ext, d.language, d.doc_type, d.role, d.created_at,
+           CAST(a.quick AS BLOB) AS quick, CAST(a.llm AS BLOB) AS llm,
+           CAST(a.compliance AS BLOB) AS compliance
+    FROM documents d
+    JOIN analyses a ON a.doc_id = d.id
+    ORDER BY d.id DESC LIMIT ?
+"""
+# JSON columns come back as bytes so they can be handed to the parser without re-encoding
+# (the casts only matter for rows stored as TEXT before the columns became BLOB)
+_SQL_RECENT_LITE = """
+    SELECT d.id, d.filename, d.ext, d.language, d.doc_type, d.role, d.created_at,
+           CAST(a.quick AS BLOB), CAST(a.llm AS BLOB)
+    FROM documents d
+    JOIN analyses a ON a.doc_id = d.id
+    ORDER BY d.id DESC LIMIT ?
+"""
+_SQL_SEARCH_FTS = """
+    SELECT d.id, d.filename, d.doc_type, d.language, snippet(docs_fts, 0, '[', ']', '…', 10)
+    FROM fts.docs_fts JOIN documents d ON d.id = docs_fts.rowid
+    WHERE docs_fts MATCH ? ORDER BY bm25(docs_fts) LIMIT ?
+"""
+_JSON_COLUMNS = (("quick", dict), ("llm", dict), ("compliance", list))
+
+
+def _rows_to_docs(rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
+    """Document dicts from recent/user-documents rows. All JSON columns of the
+    result set are joined into one array and decoded with a single parse."""
+    if not rows:
+        return []
+    blobs = [row[column] or b"null" for row in rows for column, _ in _JSON_COLUMNS]
+    values = iter(_loads(b"[" + b",".join(blobs) + b"]"))
+    docs = []
+    for row in rows:
+        doc = dict(row)
+        for column, empty in _JSON_COLUMNS:
+            doc[column] = next(values) or empty()
+        docs.append(doc)
+    return docs
+
+
+def _fts_query(query: str) -> str:
+    """Each whitespace-separated term as a quoted FTS5 string, so user input is never parsed as query syntax."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+_SQL_SEARCH_LIKE = """
+    SELECT d.id, d.filename, d.doc_type, d.language, substr(t.content, 1, 200)
+    FROM fts.doc_text t JOIN documents d ON d.id = t.id
+    WHERE t.content LIKE ? LIMIT ?
+"""
+
+
+def _legacy_fts_texts(conn: sqlite3.Connection):
+    """(doc_id, text) from the original self-contained docs_fts.
+    Its rowids are not document ids: every save appended a row, re-saves of a known hash
+    included. Rows are replayed in insertion order; a (filename, text) pair already seen
+    is a re-save, any other row belongs to the next document in id order.
+    """
+    docs = conn.execute("SELECT id, filename FROM main.documents ORDER BY id").fetchall()
+    seen = set()
+    i = 0
+    for filename, text in conn.execute("SELECT filename, content FROM main.docs_fts ORDER BY rowid"):
+        if (filename, text) in seen or i >= len(docs) or docs[i][1] != filename:
+            continue
+        seen.add((filename, text))
+        if text:
+            yield docs[i][0], text
+        i += 1
+_SQL_INSERT_USER = "INSERT INTO users(username, email, password_hash, role, created_at) VALUES (?, ?, ?, ?, ?)"
+_SQL_USER_EXISTS = "SELECT 1 FROM users WHERE username = ? LIMIT 1"
+_SQL_AUTH = "SELECT id, username, email, role, password_hash FROM users WHERE username = ?"
+_SQL_USERS = "SELECT id, username, email, role FROM users"
+# One fixed statement for any number of ids: they are bound as a single JSON array
+_SQL_EMAILS_FOR_IDS = "SELECT email FROM users WHERE id IN (SELECT value FROM json_each(?))"
+_SQL_RECIPIENT_IDS = "SELECT DISTINCT user_id FROM document_recipients WHERE doc_id = ? ORDER BY user_id"
+_SQL_INSERT_RECIPIENT = "INSERT INTO document_recipients(doc_id, user_id, sent_at) VALUES (?, ?, ?)"
+# Keyset pages walk idx_dr_user(user_id, doc_id) backwards, so no sort and no OFFSET scan.
+# A document sent to the same user again (re-upload) has several recipient rows; DISTINCT
+# keeps it to one entry, so pages are never short or split by duplicates
+_SQL_USER_DOCUMENTS = """
+    SELECT d.id, d.filename, d.ext, d.language, d.doc_type, d.role, d.created_at,
+           CAST(a.quick AS BLOB) AS quick, CAST(a.llm AS BLOB) AS llm,
+           CAST(a.compliance AS BLOB) AS compliance
+    FROM (
+        SELECT DISTINCT doc_id FROM document_recipients
+        WHERE user_id = ? AND doc_id < coalesce(?, 9223372036854775807)
+        ORDER BY doc_id DESC LIMIT ?
+    ) dr
+    JOIN documents d ON d.id = dr.doc_id
+    JOIN analyses a ON a.doc_id = d.id
+    ORDER BY dr.doc_id DESC
+"""
 
 
 class Storage:
     """SQLite-backed storage with optional FTS5 full-text search.
-    Database file: data/docsense.db
+    Database file: data/docsense.db, search index: data/fts.db (attached as "fts")
     If FTS5 is unavailable, falls back to a plain table and LIKE-based search.
     """
 
     def __init__(self, base_dir: str):
         self.base_dir = base_dir
         self.db_path = os.path.join(base_dir, "data", "docsense.db")
+        self.fts_path = os.path.join(base_dir, "data", "fts.db")
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        self._init_db()
+        self._local = threading.local()
         self._fts = False  # default; will be set during init
+        self._users_lock = threading.Lock()
+        self._users_version = 0  # bumped by create_user
+        self._users_list: Optional[tuple] = None  # (version, built_at, users)
+        self._auth_rows: "OrderedDict[str, tuple]" = OrderedDict()  # username -> (version, built_at, row)
+        self._search_lock = threading.Lock()
+        self._docs_version = 0  # bumped by save_document
+        self._search_cache: "OrderedDict[tuple, tuple]" = OrderedDict()  # (query, limit) -> (built_at, results)
+        self._init_db()
+        atexit.register(self.close)
 
-    def _conn(self):
-        return sqlite3.connect(self.db_path)
+    def _conn(self) -> sqlite3.Connection:
+        """This thread's connection, opened and tuned on first use, then reused.
+        Autocommit mode: writes group their statements with _tx().
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path, check_same_thread=False, isolation_level=None,
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+            conn.row_factory = sqlite3.Row
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            conn.execute("ATTACH DATABASE ? AS fts", (self.fts_path,))
+            for pragma in FTS_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        """Run the block in one write transaction on this thread's connection."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        """Close this thread's connection (others close when their thread goes away)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            try:
+                conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass  # e.g. database locked; statistics are only an optimisation
+            conn.close()
+            self._local.conn = None
 
     def _init_db(self):
-        with self._conn() as conn:
-            conn.execute("PRAGMA journal_mode=WAL;")
+        with self._tx() as conn:
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS users (
@@ -54,9 +331,9 @@ class Storage:
                 """
                 CREATE TABLE IF NOT EXISTS analyses (
                     doc_id INTEGER,
-                    quick JSON,
-                    llm JSON,
-                    compliance JSON,
+                    quick BLOB,  -- UTF-8 JSON
+                    llm BLOB,
+                    compliance BLOB,
                     FOREIGN KEY (doc_id) REFERENCES documents(id)
                 );
                 """
@@ -73,30 +350,48 @@ class Storage:
                 );
                 """
             )
+            # Indexes for the hot predicates (users.username is already covered by its UNIQUE index)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_dr_user ON document_recipients(user_id, doc_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_dr_doc ON document_recipients(doc_id, user_id)")
+            # One analysis per document: older databases may hold re-saves, keep only the latest
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_analyses_doc_latest'").fetchone() is None:
+                conn.execute("DELETE FROM analyses WHERE rowid NOT IN (SELECT MAX(rowid) FROM analyses GROUP BY doc_id)")
+                conn.execute("DROP INDEX IF EXISTS idx_analyses_doc")
+                conn.execute("CREATE UNIQUE INDEX idx_analyses_doc_latest ON analyses(doc_id)")
+            # Full text lives in fts.doc_text, indexed by fts.docs_fts. Older databases kept it in
+            # main (on documents.content, or as docs_fts' own copy); move it over once
+            conn.execute(_SQL_CREATE_DOC_TEXT)
+            columns = {r[1] for r in conn.execute("PRAGMA main.table_info(documents)")}
+            row = conn.execute("SELECT sql FROM main.sqlite_master WHERE name = 'docs_fts'").fetchone()
+            migrate = row is not None or "content" in columns
+            if migrate:
+                if "content" in columns:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO fts.doc_text(id, content) "
+                        "SELECT id, content FROM main.documents WHERE content IS NOT NULL"
+                    )
+                if row is not None and "content='documents'" not in row[0]:
+                    conn.executemany(_SQL_INSERT_DOC_TEXT, list(_legacy_fts_texts(conn)))
+                conn.execute("DROP TRIGGER IF EXISTS main.documents_fts_insert")
+                conn.execute("DROP TABLE IF EXISTS main.docs_fts")
+                if "content" in columns:
+                    conn.execute("ALTER TABLE main.documents DROP COLUMN content")
+            # fts.db files written before doc_text held only the text also copied filename/doc_type/language
+            text_columns = {r[1] for r in conn.execute("PRAGMA fts.table_info(doc_text)")}
+            if len(text_columns) > 2:
+                conn.execute("DROP TRIGGER IF EXISTS fts.doc_text_index")
+                conn.execute("DROP TABLE IF EXISTS fts.docs_fts")
+                for column in sorted(text_columns - {"id", "content"}):
+                    conn.execute(f"ALTER TABLE fts.doc_text DROP COLUMN {column}")
+                migrate = True
             try:
-                conn.execute(
-                    """
-                    CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
-                        content,
-                        filename,
-                        doc_type,
-                        language
-                    );
-                    """
-                )
+                conn.execute(_SQL_CREATE_FTS)
+                conn.execute(_SQL_CREATE_FTS_TRIGGER)
+                if migrate:
+                    conn.execute("INSERT INTO fts.docs_fts(docs_fts) VALUES ('rebuild')")
                 self._fts = True
             except sqlite3.OperationalError:
-                # FTS5 not available; use a normal table for fallback search
-                conn.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS docs_fts (
-                        content TEXT,
-                        filename TEXT,
-                        doc_type TEXT,
-                        language TEXT
-                    );
-                    """
-                )
+                # FTS5 not available; search falls back to LIKE over fts.doc_text
                 self._fts = False
 
     def save_document(
@@ -109,71 +404,69 @@ class Storage:
         compliance: List[Dict[str, Any]],
         fulltext: str,
     ) -> int:
-        created_at = datetime.utcnow().isoformat()
-        with self._conn() as conn:
+        created_at = _utc_now()
+        # Encode before taking the write lock so the transaction only does I/O
+        analysis = (_dumps(quick), _dumps(llm) if llm else None, _dumps(compliance))
+        with self._tx() as conn:
             cur = conn.cursor()
-            # Upsert-like logic for deduplication by file_hash
+            # Deduplicate by file_hash
             cur.execute(
-                "SELECT id FROM documents WHERE file_hash = ?",
-                (file_hash,),
-            )
-            row = cur.fetchone()
-            if row:
-                doc_id = row[0]
-                # Overwrite analyses to keep latest
-                cur.execute("DELETE FROM analyses WHERE doc_id = ?", (doc_id,))
-            else:
-                cur.execute(
-                    "INSERT INTO documents(filename, file_hash, ext, language, doc_type, role, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (
-                        os.path.basename(filename),
-                        file_hash,
-                        meta.get("ext"),
-                        meta.get("language"),
-                        meta.get("doc_type"),
-                        meta.get("suggested_role"),
-                        created_at,
-                    ),
-                )
-                doc_id = cur.lastrowid
-
-            cur.execute(
-                "INSERT INTO analyses(doc_id, quick, llm, compliance) VALUES (?, ?, ?, ?)",
+                _SQL_UPSERT_DOC,
                 (
-                    doc_id,
-                    json.dumps(quick, ensure_ascii=False),
-                    json.dumps(llm, ensure_ascii=False) if llm else None,
-                    json.dumps(compliance, ensure_ascii=False),
-                ),
-            )
-            # Index content for search
-            cur.execute(
-                "INSERT INTO docs_fts(content, filename, doc_type, language) VALUES (?, ?, ?, ?)",
-                (
-                    fulltext or "",
                     os.path.basename(filename),
-                    meta.get("doc_type"),
+                    file_hash,
+                    meta.get("ext"),
                     meta.get("language"),
+                    meta.get("doc_type"),
+                    meta.get("suggested_role"),
+                    created_at,
                 ),
             )
+            doc_id = cur.fetchone()[0]
+            # Text for search; docs_fts is filled by its insert trigger. Nothing to index
+            # for documents without extractable text
+            if fulltext:
+                cur.execute(_SQL_INSERT_DOC_TEXT, (doc_id, fulltext))
+
+            # Overwrite analyses to keep latest
+            cur.execute(_SQL_UPSERT_ANALYSIS, (doc_id, *analysis))
+        with self._search_lock:
+            self._docs_version += 1
+            self._search_cache.clear()
+            analyze = self._docs_version % ANALYZE_EVERY == 0
+        if analyze:
+            # Keep row counts current so the joins in recent()/get_user_documents() plan well
+            conn.execute("ANALYZE main")
         return doc_id
 
     def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
-        with self._conn() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                SELECT d.id, d.filename, d.ext, d.language, d.doc_type, d.role, d.created_at,
-                       a.quick, a.llm, a.compliance
-                FROM documents d
-                JOIN analyses a ON a.doc_id = d.id
-                ORDER BY d.id DESC LIMIT ?
-                """,
-                (limit,),
-            )
-            rows = cur.fetchall()
+        conn = self._conn()
+        cur = conn.cursor()
+        cur.execute(_SQL_RECENT, (limit,))
+        return _rows_to_docs(cur.fetchall())
+
+    def recent_lite(self, limit: int = 20, fields: Sequence[str] = ("quick/risks", "llm/summary")) -> List[Dict[str, Any]]:
+        """Like recent(), but quick/llm only carry the requested "column/key" fields.
+        With cysimdjson installed only those keys are materialised; the rest of each
+        blob is never turned into Python objects.
+        """
+        wanted: Dict[str, List[str]] = {"quick": [], "llm": []}
+        for field in fields:
+            column, _, key = field.partition("/")
+            if column not in wanted or not key:
+                raise ValueError(f"fields must look like 'quick/<key>' or 'llm/<key>', got {field!r}")
+            wanted[column].append(key)
+
+        parser = None
+        if cysimdjson is not None:
+            parser = getattr(self._local, "json_parser", None)
+            if parser is None:
+                parser = self._local.json_parser = cysimdjson.JSONParser()
+
+        cur = self._conn().cursor()
+        cur.execute(_SQL_RECENT_LITE, (limit,))
         out: List[Dict[str, Any]] = []
-        for r in rows:
+        for r in cur.fetchall():
             out.append(
                 {
                     "id": r[0],
@@ -183,38 +476,43 @@ class Storage:
                     "doc_type": r[4],
                     "role": r[5],
                     "created_at": r[6],
-                    "quick": json.loads(r[7]) if r[7] else {},
-                    "llm": json.loads(r[8]) if r[8] else {},
-                    "compliance": json.loads(r[9]) if r[9] else [],
+                    "quick": _pick(parser, r[7], wanted["quick"]),
+                    "llm": _pick(parser, r[8], wanted["llm"]),
                 }
             )
         return out
 
     def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
-        if not query:
+        if not query or not query.strip():
             return []
-        with self._conn() as conn:
-            cur = conn.cursor()
-            try:
-                cur.execute(
-                    """
-                    SELECT rowid, filename, doc_type, language, snippet(docs_fts, 0, '[', ']', '…', 10)
-                    FROM docs_fts WHERE docs_fts MATCH ? LIMIT ?
-                    """,
-                    (query, limit),
-                )
-                rows = cur.fetchall()
-            except sqlite3.OperationalError:
-                # Fallback LIKE-based search
-                like = f"%{query}%"
-                cur.execute(
-                    """
-                    SELECT NULL as rowid, filename, doc_type, language, substr(content, 1, 200)
-                    FROM docs_fts WHERE content LIKE ? LIMIT ?
-                    """,
-                    (like, limit),
-                )
-                rows = cur.fetchall()
+        key = (query, limit)
+        now = time.monotonic()
+        with self._search_lock:
+            version = self._docs_version
+            hit = self._search_cache.get(key)
+            if hit and now - hit[0] < SEARCH_CACHE_TTL:
+                self._search_cache.move_to_end(key)
+                return [dict(r) for r in hit[1]]
+        results = self._search(query, limit)
+        with self._search_lock:
+            # Skip if a save landed meanwhile; the results may predate it
+            if version == self._docs_version:
+                self._search_cache[key] = (now, results)
+                if len(self._search_cache) > SEARCH_CACHE_SIZE:
+                    self._search_cache.popitem(last=False)
+        return [dict(r) for r in results]
+
+    def _search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        conn = self._conn()
+        cur = conn.cursor()
+        try:
+            cur.execute(_SQL_SEARCH_FTS, (_fts_query(query), limit))
+            rows = cur.fetchall()
+        except sqlite3.OperationalError:
+            # Fallback LIKE-based search
+            like = f"%{query}%"
+            cur.execute(_SQL_SEARCH_LIKE, (like, limit))
+            rows = cur.fetchall()
         results: List[Dict[str, Any]] = []
         for r in rows:
             results.append(
@@ -229,74 +527,94 @@ class Storage:
         return results
 
     def create_user(self, username: str, email: str, password_hash: str, role: str = "employee") -> int:
-        created_at = datetime.utcnow().isoformat()
-        with self._conn() as conn:
+        created_at = _utc_now()
+        with self._tx() as conn:
             cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO users(username, email, password_hash, role, created_at) VALUES (?, ?, ?, ?, ?)",
-                (username, email, password_hash, role, created_at),
-            )
-            return cur.lastrowid
+            cur.execute(_SQL_INSERT_USER, (username, email, password_hash, role, created_at))
+            user_id = cur.lastrowid
+        with self._users_lock:
+            self._users_version += 1
+        return user_id
 
-    def authenticate_user(self, username: str, password_hash: str) -> Optional[Dict[str, Any]]:
-        with self._conn() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT id, username, email, role FROM users WHERE username = ? AND password_hash = ?",
-                (username, password_hash),
-            )
-            row = cur.fetchone()
-            if row:
-                return {"id": row[0], "username": row[1], "email": row[2], "role": row[3]}
-            return None
+    def user_exists(self, username: str) -> bool:
+        conn = self._conn()
+        cur = conn.cursor()
+        cur.execute(_SQL_USER_EXISTS, (username,))
+        return cur.fetchone() is not None
+
+    def authenticate_user(self, username: str, password: str) -> Optional[Dict[str, Any]]:
+        """Return the user if password matches the stored hash, else None.
+        The row is cached by username; the password itself is checked on every call.
+        """
+        row = self._auth_row(username)
+        if row and row[4] and verify_password(password, row[4]):
+            return {"id": row[0], "username": row[1], "email": row[2], "role": row[3]}
+        return None
+
+    def _auth_row(self, username: str) -> Optional[tuple]:
+        now = time.monotonic()
+        with self._users_lock:
+            version = self._users_version
+            hit = self._auth_rows.get(username)
+            if hit and hit[0] == version and now - hit[1] < USER_CACHE_TTL:
+                self._auth_rows.move_to_end(username)
+                return hit[2]
+        cur = self._conn().cursor()
+        cur.execute(_SQL_AUTH, (username,))
+        row = cur.fetchone()
+        if row is None:
+            return None  # not cached: the user may be registered any moment
+        row = tuple(row)
+        with self._users_lock:
+            self._auth_rows[username] = (version, now, row)
+            self._auth_rows.move_to_end(username)
+            if len(self._auth_rows) > USER_CACHE_SIZE:
+                self._auth_rows.popitem(last=False)
+        return row
 
     def get_users(self) -> List[Dict[str, Any]]:
-        with self._conn() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT id, username, email, role FROM users")
-            rows = cur.fetchall()
-            return [{"id": r[0], "username": r[1], "email": r[2], "role": r[3]} for r in rows]
+        now = time.monotonic()
+        with self._users_lock:
+            version = self._users_version
+            cached = self._users_list
+        if cached is None or cached[0] != version or now - cached[1] >= USER_CACHE_TTL:
+            cur = self._conn().cursor()
+            cur.execute(_SQL_USERS)
+            cached = (version, now, [dict(r) for r in cur])
+            with self._users_lock:
+                self._users_list = cached
+        # Copies, so callers can't edit the cached entries
+        return [dict(u) for u in cached[2]]
+
+    def get_emails_for_ids(self, ids: List[int]) -> List[str]:
+        """Emails for the given user ids in a single indexed query."""
+        ids = sorted(set(ids))
+        if not ids:
+            return []
+        conn = self._conn()
+        cur = conn.cursor()
+        cur.execute(_SQL_EMAILS_FOR_IDS, (json.dumps(ids),))
+        return [r[0] for r in cur.fetchall()]
 
     def save_recipients(self, doc_id: int, user_ids: List[int]):
-        sent_at = datetime.utcnow().isoformat()
-        with self._conn() as conn:
-            cur = conn.cursor()
-            for user_id in user_ids:
-                cur.execute(
-                    "INSERT INTO document_recipients(doc_id, user_id, sent_at) VALUES (?, ?, ?)",
-                    (doc_id, user_id, sent_at),
-                )
-
-    def get_user_documents(self, user_id: int) -> List[Dict[str, Any]]:
-        with self._conn() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                SELECT d.id, d.filename, d.ext, d.language, d.doc_type, d.role, d.created_at,
-                       a.quick, a.llm, a.compliance
-                FROM documents d
-                JOIN analyses a ON a.doc_id = d.id
-                JOIN document_recipients dr ON dr.doc_id = d.id
-                WHERE dr.user_id = ?
-                ORDER BY d.id DESC
-                """,
-                (user_id,),
-            )
-            rows = cur.fetchall()
-            out: List[Dict[str, Any]] = []
-            for r in rows:
-                out.append(
-                    {
-                        "id": r[0],
-                        "filename": r[1],
-                        "ext": r[2],
-                        "language": r[3],
-                        "doc_type": r[4],
-                        "role": r[5],
-                        "created_at": r[6],
-                        "quick": json.loads(r[7]) if r[7] else {},
-                        "llm": json.loads(r[8]) if r[8] else {},
-                        "compliance": json.loads(r[9]) if r[9] else [],
-                    }
-                )
-            return out
\ No newline at end of file
+        sent_at = _utc_now()
+        if not user_ids:
+            return
+        with self._tx() as conn:
+            conn.executemany(_SQL_INSERT_RECIPIENT, [(doc_id, user_id, sent_at) for user_id in user_ids])
+
+    def get_recipient_ids(self, doc_id: int) -> List[int]:
+        """Every user the document has been sent to, across all of its uploads."""
+        cur = self._conn().cursor()
+        cur.execute(_SQL_RECIPIENT_IDS, (doc_id,))
+        return [r[0] for r in cur.fetchall()]
+
+    def get_user_documents(self, user_id: int, limit: Optional[int] = None,
+                           before_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Newest first. All of them by default; with a limit, one page at a time:
+        pass the last id of a page as before_id to get the next."""
+        conn = self._conn()
+        cur = conn.cursor()
+        # LIMIT -1 is SQLite for "no limit"
+        cur.execute(_SQL_USER_DOCUMENTS, (user_id, before_id, -1 if limit is None else limit))
+        return _rows_to_docs(cur.fetchall())
\ No newline at end of file